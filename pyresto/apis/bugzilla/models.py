@@ -1,10 +1,13 @@
 # coding: utf-8
 
-from operator import itemgetter  # built-in
+import urlparse  # built-in
 
 from requests.auth import AuthBase  # third party
 
+from pyresto.concurrency import BatchResult, map_collect
 from pyresto.core import Model
+from pyresto.exceptions import PyrestoServerResponseException
+from pyresto.identity import current_identity_map
 from pyresto.relations import Foreign, Many
 from pyresto.auth import AuthList, enable_auth
 
@@ -25,8 +28,10 @@ class BugzillaModel(Model):
     _url_base = __service_url__
 
     def __repr__(self):
-        if hasattr(self, 'ref'):
-            desc = self.ref
+        # look at the data at hand only, a repr must not cause a request
+        data = self.__dict__
+        if 'ref' in data:
+            desc = data['ref']
         else:
             desc = self._current_path
 
@@ -43,6 +48,16 @@ class BugzillaModel(Model):
         return super(BugzillaModel, cls)._rest_call(url, method, fetch_all,
                                                     **kwargs)
 
+    @classmethod
+    def _project_path(cls, path, fields):
+        # let the server leave out the other fields via include_fields
+        path, _, query = path.partition('?')
+        params = ['{0}={1}'.format(key, value) for key, value in
+                  urlparse.parse_qsl(query, True)
+                  if key not in ('include_fields', 'exclude_fields')]
+        params.append('include_fields=' + ','.join(sorted(fields)))
+        return path + '?' + '&'.join(params)
+
 
 class User(BugzillaModel):
     _path = 'user/{email}'
@@ -81,27 +96,154 @@ class Attachment(BugzillaModel):
 
     attacher = Foreign(User, '__attacher', embedded=True)
     flags = Many(Flag, 'attachment/{id}?include_fields=flags',
-                 preprocessor=itemgetter('flags'))
+                 preprocessor='flags')
 
 
 class Bug(BugzillaModel):
     _path = 'bug/{id}'
     _pk = 'id'
 
+    # maximum number of ids sent in a single multi-id request
+    _batch_size = 100
+
+    @classmethod
+    def read_many(cls, keys, concurrency=4, **kwargs):
+        # Collapse the reads into the multi-id form of the bug endpoint,
+        # `bug?id=1,2,3`, so N bugs cost N / _batch_size requests. Anything
+        # it cannot express, such as an exact path, falls back to a read per
+        # bug.
+        if set(kwargs) - set(('auth', 'fields', 'include', 'parent')):
+            return super(Bug, cls).read_many(keys, concurrency, **kwargs)
+
+        auth = kwargs.get('auth', cls._auth)
+        fields = kwargs.get('fields', cls._fields)
+        include = tuple(kwargs.get('include') or ())
+        parent = kwargs.get('parent')
+        ids = [str(key[0] if isinstance(key, tuple) else key) for key in keys]
+
+        unique_ids = list()
+        seen = set()
+        for id in ids:
+            if id not in seen:
+                seen.add(id)
+                unique_ids.append(id)
+
+        base = getattr(parent, '_current_path', '') + 'bug?id='
+        if fields:
+            # the same fields Bug.read would fetch, plus the ids to match
+            fields = frozenset(fields) | frozenset(include)
+            make_path = lambda chunk: cls._project_path(
+                base + ','.join(chunk), fields | frozenset(('id',)))
+        else:
+            excluded = [f for f in cls._many_fields if f not in include]
+            query = '&include_fields={0}&exclude_fields={1}'.format(
+                ','.join(('_all',) + include), ','.join(excluded))
+            make_path = lambda chunk: base + ','.join(chunk) + query
+
+        chunks = [unique_ids[i:i + cls._batch_size]
+                  for i in xrange(0, len(unique_ids), cls._batch_size)]
+
+        def fetch(chunk):
+            data = cls._rest_call(url=make_path(chunk), auth=auth).data
+            return data and data.get('bugs') or list()
+
+        pages = map_collect(fetch, chunks, concurrency)
+
+        identities = current_identity_map()
+        bugs = dict()
+        errors = dict()
+        for index, chunk in enumerate(chunks):
+            for id in chunk:
+                if index in pages.errors:
+                    errors[id] = pages.errors[index]
+            for data in pages[index] or ():
+                if fields:
+                    data = cls._project(data, fields)
+                instance = cls(parent=parent, **data)
+                instance._pk_vals = (data['id'],)
+                instance._fetched = True
+                if fields:
+                    instance._projection = fields
+                if auth:
+                    instance._auth = auth
+                instance.__seed(include)
+                if identities is not None:
+                    instance = identities.add(instance)
+                bugs[str(data['id'])] = instance
+
+        results = BatchResult()
+        for index, id in enumerate(ids):
+            results.append(bugs.get(id))
+            if id in errors:
+                results.errors[index] = errors[id]
+            elif id not in bugs:
+                # the server leaves out the bugs it does not know of
+                results.errors[index] = PyrestoServerResponseException(
+                    'Bug {0} was not returned by the server.'.format(id), 404)
+
+        return results
+
     @classmethod
     def init_many_fields(cls, many_fields):
         for field, model in many_fields.iteritems():
             path = cls._path + '?include_fields=' + field
             if model is cls:
-                preprocessor = lambda d: list(dict(id=b) for b in d[field])
+                preprocessor = lambda d, field=field: list(dict(id=b)
+                                                           for b in d[field])
             else:
-                preprocessor = itemgetter(field)
+                preprocessor = field
             setattr(cls, field, Many(model, path, preprocessor=preprocessor))
+        cls._many_fields = tuple(many_fields)
         cls._path = cls._path + '?include_fields=_all&exclude_fields=' + \
                    ','.join(many_fields.keys())
 
         return cls
 
+    @classmethod
+    def read(cls, *args, **kwargs):
+        # `include` names the many fields to fetch in the same request
+        include = tuple(kwargs.pop('include', None) or ())
+        if include:
+            fields = kwargs.get('fields', cls._fields)
+            if fields:
+                kwargs['fields'] = tuple(fields) + include
+            elif 'path' not in kwargs:
+                excluded = [f for f in cls._many_fields if f not in include]
+                kwargs['path'] = '{0}?include_fields=_all,{1}' \
+                                 '&exclude_fields={2}'.format(
+                    cls._path.partition('?')[0].format(id=args[0]),
+                    ','.join(include), ','.join(excluded))
+
+        instance = super(Bug, cls).read(*args, **kwargs)
+        if instance is not None:
+            instance.__seed(include)
+
+        return instance
+
+    def prefetch(self, *fields):
+        """
+        Fetches the given many fields of the bug, all in a single request,
+        so accessing them later does not cause any more requests.
+        """
+        fields = [f for f in fields or self._many_fields
+                  if self not in self.__class__.__dict__[f].cache]
+        if fields:
+            path = self._current_path.partition('?')[0] + \
+                '?include_fields=' + ','.join(fields)
+            data = self._rest_call(url=path, auth=self._auth).data or dict()
+            for field in fields:
+                if field in data:
+                    self.__class__.__dict__[field].seed(self, data)
+
+        return self
+
+    def __seed(self, fields):
+        relations = self.__class__.__dict__
+        for field in fields:
+            # the data of relation fields is stored with a "__" prefix
+            data = self.__dict__.pop('__' + field, None)
+            if data is not None:
+                relations[field].seed(self, {field: data})
 
     assigned_to = Foreign(User, '__assigned_to', embedded=True)
     creator = Foreign(User, '__creator', embedded=True)
@@ -1,10 +1,15 @@
 # coding: utf-8
 
+import re  # built-in
+import urllib
+import urlparse
+
 from requests.auth import AuthBase, HTTPBasicAuth  # third party
 
 from ...core import Model
 from ...relations import Foreign, Many
-from ...auth import AuthList, enable_auth
+from ...auth import AuthList, AuthPool, enable_auth
+from ...ratelimit import RateLimiter
 
 
 class AppQSAuth(AuthBase):
@@ -19,14 +24,66 @@ class AppQSAuth(AuthBase):
         return req
 
 
+_link_re = re.compile(r'<([^>]+)>\s*;\s*rel="?([^",;]+)"?')
+
+
+class PageLink(unicode):
+    """
+    The continuation URL of a paginated GitHub response, which also holds the
+    URL of the last page advertised in the ``Link`` header.
+    """
+    last = None
+
+
+def _page_url(url, page):
+    parts = urlparse.urlsplit(url)
+    query = [(k, str(page) if k == 'page' else v)
+             for k, v in urlparse.parse_qsl(parts.query, True)]
+    return urlparse.urlunsplit(parts[:3] + (urllib.urlencode(query),
+                                            parts[4]))
+
+
+def _page_number(url):
+    query = urlparse.parse_qs(urlparse.urlsplit(url).query)
+    try:
+        return int(query['page'][0])
+    except (KeyError, ValueError):
+        return None
+
+
 class GitHubModel(Model):
     _url_base = 'https://api.github.com'
+    _fan_out = 8
+
+    @classmethod
+    def _continuator(cls, response):
+        links = dict((rel, url) for url, rel in
+                     _link_re.findall(response.headers.get('link') or ''))
+        if 'next' not in links:
+            return None
+
+        link = PageLink(links['next'])
+        link.last = links.get('last')
+        return link
+
+    @classmethod
+    def _page_urls(cls, continuation_url):
+        last = getattr(continuation_url, 'last', None)
+        first_page = _page_number(continuation_url)
+        last_page = last and _page_number(last)
+        if not (first_page and last_page):
+            return None
+
+        return [_page_url(continuation_url, page)
+                for page in xrange(first_page, last_page + 1)]
 
     def __repr__(self):
-        if hasattr(self, '_links'):
-            desc = self._links['self']
-        elif hasattr(self, 'url'):
-            desc = self.url
+        # look at the data at hand only, a repr must not cause a request
+        data = self.__dict__
+        if '_links' in data:
+            desc = data['_links']['self']
+        elif 'url' in data:
+            desc = data['url']
         else:
             desc = self._current_path
 
@@ -102,7 +159,11 @@ User.follower_list = Many(User, '{self._current_path}/followers?per_page=100')
 User.watched = Many(Repo, '{self._current_path}/watched?per_page=100')
 
 # Define authentication methods
-auths = AuthList(basic=HTTPBasicAuth, app=AppQSAuth)
+auths = AuthList(basic=HTTPBasicAuth, app=AppQSAuth, pool=AuthPool)
 
 # Enable and publish global authentication
 auth = enable_auth(auths, GitHubModel, 'app')
+
+# Pace the requests to stay within the rate limit of every credential
+rate_limiter = RateLimiter()
+GitHubModel._scheduler = rate_limiter
@@ -1,9 +1,11 @@
 __author__ = 'pavelmeshkoy'
+import threading
+import time
 from requests.auth import AuthBase
 from abc import ABCMeta, abstractmethod
 from pyresto.exceptions import *
 
-__all__ = ('Auth', 'AuthList', 'enable_auth')
+__all__ = ('Auth', 'AuthList', 'AuthPool', 'enable_auth', 'auth_identity')
 
 
 class Auth(AuthBase):
@@ -39,6 +41,130 @@ class AuthList(dict):
         self[attr] = value
 
 
+class _Credential(object):
+    def __init__(self, auth):
+        self.auth = auth
+        self.requests = 0
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.blocked_until = 0
+
+    def available(self, now):
+        if self.blocked_until > now:
+            return False
+        return not (self.remaining == 0 and self.reset and self.reset > now)
+
+    def available_at(self):
+        if self.remaining == 0 and self.reset:
+            return max(self.reset, self.blocked_until)
+        return self.blocked_until
+
+
+class AuthPool(AuthBase):
+    """
+    An authentication object which holds several credentials and signs every
+    request with the one having the most of its rate limit left, according to
+    the ``X-RateLimit-*`` headers of the previous responses. Credentials which
+    have used up their rate limit, or were told to back off with a
+    ``Retry-After`` header, are skipped until they are usable again. Register
+    it in an :class:`AuthList` to use it through :func:`enable_auth`:
+
+    .. code-block:: python
+
+        auth('pool', credentials=[HTTPBasicAuth('a', 'x'),
+                                  HTTPBasicAuth('b', 'y')])
+
+    """
+
+    _time = staticmethod(time.time)
+
+    def __init__(self, credentials):
+        """
+        :param credentials: The authentication objects to use in turns.
+        :type credentials: list
+        """
+        self.__credentials = [_Credential(auth) for auth in credentials]
+        if not self.__credentials:
+            raise PyrestoInvalidAuthTypeException('No credentials given.')
+        self.__lock = threading.Lock()
+
+    def __choose(self):
+        now = self._time()
+        with self.__lock:
+            available = [c for c in self.__credentials if c.available(now)]
+            if available:
+                # unknown quota first, to find it out, then the most remaining
+                credential = max(available, key=lambda c: (
+                    c.remaining is None, c.remaining, -c.requests))
+            else:
+                credential = min(self.__credentials,
+                                 key=_Credential.available_at)
+
+            credential.requests += 1
+            if credential.remaining:
+                credential.remaining -= 1
+            return credential
+
+    def __observe(self, credential, response):
+        headers = response.headers
+        with self.__lock:
+            try:
+                if headers.get('x-ratelimit-limit') is not None:
+                    credential.limit = int(headers['x-ratelimit-limit'])
+                if headers.get('x-ratelimit-remaining') is not None:
+                    credential.remaining = int(
+                        headers['x-ratelimit-remaining'])
+                if headers.get('x-ratelimit-reset') is not None:
+                    credential.reset = float(headers['x-ratelimit-reset'])
+                if response.status_code in (403, 429) and \
+                        headers.get('retry-after') is not None:
+                    credential.blocked_until = self._time() + \
+                        float(headers['retry-after'])
+            except ValueError:
+                pass
+
+    def __call__(self, req):
+        credential = self.__choose()
+        req = credential.auth(req)
+
+        def observe(response, *args, **kwargs):
+            self.__observe(credential, response)
+            return response
+
+        req.register_hook('response', observe)
+        return req
+
+    def wait_time(self):
+        """
+        Returns the number of seconds until one of the credentials can be
+        used again, ``0`` if there is one available right now.
+        """
+        now = self._time()
+        with self.__lock:
+            if any(c.available(now) for c in self.__credentials):
+                return 0
+            return max(min(c.available_at() for c in self.__credentials) -
+                       now, 0)
+
+    def stats(self):
+        """
+        Returns a list with a dict for every credential holding the number of
+        ``requests`` made with it, its last known ``limit``, ``remaining``
+        and ``reset`` values, whether it is ``available`` and its
+        ``utilisation``, the used fraction of its rate limit.
+        """
+        now = self._time()
+        with self.__lock:
+            return [dict(identity=auth_identity(c.auth), requests=c.requests,
+                         limit=c.limit, remaining=c.remaining, reset=c.reset,
+                         available=c.available(now),
+                         utilisation=(float(c.limit - c.remaining) / c.limit
+                                      if c.limit and c.remaining is not None
+                                      else None))
+                    for c in self.__credentials]
+
+
 def enable_auth(supported_types, base_model, default_type):
     """
     A "global authentication enabler" function generator. See
@@ -73,4 +199,26 @@ def enable_auth(supported_types, base_model, default_type):
 
         base_model._auth = supported_types[type](**kwargs)
 
-    return auth
\ No newline at end of file
+    return auth
+
+
+def auth_identity(auth):
+    """
+    Returns a hashable value identifying the credentials of an authentication
+    object, used to keep per-user state such as cached responses apart. The
+    ``username`` or ``client_id`` attribute is used when available and the
+    object itself otherwise.
+
+    :param auth: The authentication object or ``None``.
+
+    :rtype: tuple or None
+    """
+    if auth is None:
+        return None
+
+    for attr in ('username', 'client_id'):
+        value = getattr(auth, attr, None)
+        if value is not None:
+            return auth.__class__.__name__, value
+
+    return auth.__class__.__name__, id(auth)
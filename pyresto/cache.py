@@ -0,0 +1,256 @@
+# coding: utf-8
+
+"""
+pyresto.cache
+~~~~~~~~~~~~~
+
+This module contains the response cache backends used by :class:`Model` to
+make conditional HTTP requests. A cached response is revalidated with the
+``If-None-Match`` and ``If-Modified-Since`` headers and its body is reused
+when the server answers with ``304 Not Modified``.
+
+It also contains :class:`RelationCache` which holds the resolved values of
+the :class:`Many` and :class:`Foreign` relations per owner instance.
+
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+import weakref
+from abc import ABCMeta, abstractmethod
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    from collections import OrderedDict
+except ImportError:  # Python 2.6
+    from ordereddict import OrderedDict
+
+__all__ = ('CacheEntry', 'ResponseCache', 'MemoryCache', 'DiskCache',
+           'RelationCache')
+
+#: The record stored for every cached response. ``data`` is the unparsed
+#: response body, which is parsed again on every hit so callers never share
+#: the cached data, and ``size`` is its size in bytes.
+CacheEntry = collections.namedtuple('CacheEntry', 'etag last_modified data '
+                                                  'continuation_url size')
+
+
+class ResponseCache(object):
+    """
+    Abstract base class for all response cache backends. Keys are hashable
+    tuples built by :meth:`Model._cache_key` and values are :data:`CacheEntry`
+    records.
+
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the :data:`CacheEntry` for ``key`` or ``None``."""
+
+    @abstractmethod
+    def set(self, key, entry):
+        """Stores the :data:`CacheEntry` under ``key``."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes the entry for ``key`` if there is any."""
+
+    @abstractmethod
+    def clear(self):
+        """Removes all the entries."""
+
+
+class MemoryCache(ResponseCache):
+    """
+    An in-memory, least recently used response cache which keeps the total
+    size of the cached response bodies under ``max_bytes``.
+
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__entries[key] = entry  # mark as most recently used
+            return entry
+
+    def set(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+
+            self.__entries[key] = entry
+            self.size += entry.size
+
+            while self.size > self.max_bytes:
+                oldest_key, oldest = self.__entries.popitem(last=False)
+                self.size -= oldest.size
+
+    def delete(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+
+class DiskCache(ResponseCache):
+    """
+    A response cache which pickles every entry into its own file under
+    ``directory``, so it can be shared between processes and survive
+    restarts.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __path(self, key):
+        name = hashlib.sha1(repr(key)).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def get(self, key):
+        try:
+            with open(self.__path(key), 'rb') as cache_file:
+                return CacheEntry(*pickle.load(cache_file))
+        except (IOError, EOFError, pickle.UnpicklingError, TypeError):
+            return None
+
+    def set(self, key, entry):
+        path = self.__path(key)
+        temp_path = '{0}.{1}-{2}.tmp'.format(path, os.getpid(),
+                                             threading.current_thread().ident)
+        with open(temp_path, 'wb') as cache_file:
+            pickle.dump(tuple(entry), cache_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, path)  # atomic, readers never see half a file
+
+    def delete(self, key):
+        try:
+            os.remove(self.__path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class RelationCache(object):
+    """
+    A cache for relation values keyed by their owner :class:`Model` instance.
+    Owners are referenced weakly so an entry goes away with its owner. The
+    number of entries can be limited with ``max_size``, evicting the least
+    recently used owner first, and entries older than ``ttl`` seconds are
+    treated as missing.
+
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # id(owner) -> (weakref to owner, value, time stored)
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, owner):
+        entry = self.__entries.get(id(owner))
+        return entry is not None and entry[0]() is owner and \
+            not self.__expired(entry)
+
+    def __expired(self, entry):
+        return self.ttl is not None and time.time() - entry[2] > self.ttl
+
+    def __discard(self, key, ref):
+        # weakref callback, the owner is being garbage collected
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del self.__entries[key]
+
+    def get(self, owner, default=None):
+        """Returns the cached value for ``owner`` or ``default``."""
+        key = id(owner)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0]() is owner:
+                if not self.__expired(entry):
+                    del self.__entries[key]
+                    self.__entries[key] = entry  # most recently used
+                    self.hits += 1
+                    return entry[1]
+
+                del self.__entries[key]
+                self.evictions += 1
+
+            self.misses += 1
+            return default
+
+    def set(self, owner, value):
+        """Caches ``value`` for ``owner``."""
+        key = id(owner)
+        ref = weakref.ref(owner, lambda ref: self.__discard(key, ref))
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (ref, value, time.time())
+
+            if self.max_size is not None:
+                while len(self.__entries) > self.max_size:
+                    self.__entries.popitem(last=False)
+                    self.evictions += 1
+
+    def invalidate(self, owner=None):
+        """
+        Removes the cached value for ``owner`` or all the cached values if
+        ``owner`` is omitted.
+        """
+        with self.__lock:
+            if owner is None:
+                self.__entries.clear()
+            else:
+                entry = self.__entries.get(id(owner))
+                if entry is not None and entry[0]() is owner:
+                    del self.__entries[id(owner)]
+
+    def stats(self):
+        """
+        Returns a dict with the ``size`` of the cache and its ``hits``,
+        ``misses`` and ``evictions`` counters.
+        """
+        return dict(size=len(self), hits=self.hits, misses=self.misses,
+                    evictions=self.evictions)
@@ -0,0 +1,72 @@
+# coding: utf-8
+
+"""
+pyresto.changes
+~~~~~~~~~~~~~~~
+
+This module contains the change tracking used by :meth:`Model.update` to send
+only what changed since an instance was fetched. Instead of a deep copy of
+the fetched data, a snapshot keeps a tree with a subtree per nested object,
+a reference to every immutable scalar, which costs no copy, and an MD5 digest
+of everything else, such as lists. Comparing the current data with it gives
+the smallest JSON merge patch (:rfc:`7386`), including the changes made in
+place inside nested objects and lists.
+
+"""
+
+import hashlib
+
+__all__ = ('UNCHANGED', 'snapshot', 'merge_patch')
+
+#: Returned by :func:`merge_patch` when nothing changed.
+UNCHANGED = object()
+
+
+# the values kept as they are, only the same value is equal to them
+_SCALARS = (basestring, bool, int, long, float, type(None))
+
+
+def snapshot(value):
+    """
+    Returns the snapshot of ``value``: the dict of the snapshots of its items
+    for dicts, the value and its type for scalars and a digest of the value
+    for anything else.
+    """
+
+    if isinstance(value, dict):
+        return dict((key, snapshot(item)) for key, item in value.iteritems())
+
+    if isinstance(value, _SCALARS):
+        # the type is part of the snapshot since 1 == 1.0 == True
+        return type(value), value
+
+    # equal values may have different reprs, which only makes them look
+    # changed, never the other way around
+    return hashlib.md5(repr(value)).digest()
+
+
+def merge_patch(value, previous):
+    """
+    Returns the merge patch which turns the value ``previous`` is the
+    snapshot of into ``value``, or :data:`UNCHANGED`. Nested objects only
+    contain their changed items and removed items are ``None``.
+    """
+
+    if not isinstance(previous, dict) or not isinstance(value, dict):
+        return UNCHANGED if snapshot(value) == previous else value
+
+    patch = dict()
+    for key, item in value.iteritems():
+        if key not in previous:
+            patch[key] = item
+            continue
+
+        item_patch = merge_patch(item, previous[key])
+        if item_patch is not UNCHANGED:
+            patch[key] = item_patch
+
+    for key in previous:
+        if key not in value:
+            patch[key] = None
+
+    return patch or UNCHANGED
@@ -3,6 +3,8 @@ import requests
 import urlparse
 from abc import ABCMeta, abstractproperty
 
+from pyresto.transport import get_transport
+
 
 __doc__ = """
             Base http client for sending http requests of different types
@@ -32,10 +34,15 @@ class BaseClient(AbstractBaseClient):
             self.url = urlparse.urljoin(self.__base_url, uri)
         self.auth = auth
 
+    @property
+    def transport(self):
+        return get_transport(self.url)
+
     def get(self, **kwargs):
-        kwargs['auth'] = self.auth
+        # the keyword arguments are the query parameters
         try:
-            response = requests.get(self.url, kwargs)
+            response = self.transport.request('get', self.url, params=kwargs,
+                                              auth=self.auth)
             response.raise_for_status()
         except requests.HTTPError, e:
             logging.error(e)
@@ -45,7 +52,8 @@ class BaseClient(AbstractBaseClient):
     def post(self, data=None, **kwargs):
         kwargs['auth'] = self.auth
         try:
-            response = requests.post(self.url, data=data, **kwargs)
+            response = self.transport.request('post', self.url, data=data,
+                                              **kwargs)
             response.raise_for_status()
         except requests.HTTPError, e:
             logging.error(e)
@@ -55,7 +63,8 @@ class BaseClient(AbstractBaseClient):
     def put(self, data=None, **kwargs):
         kwargs['auth'] = self.auth
         try:
-            response = requests.put(self.url, data, **kwargs)
+            response = self.transport.request('put', self.url, data=data,
+                                              **kwargs)
             response.raise_for_status()
         except requests.HTTPError, e:
             logging.error(e)
@@ -65,7 +74,7 @@ class BaseClient(AbstractBaseClient):
     def delete(self, **kwargs):
         kwargs['auth'] = self.auth
         try:
-            response = requests.delete(self.url, **kwargs)
+            response = self.transport.request('delete', self.url, **kwargs)
             response.raise_for_status()
         except requests.HTTPError, e:
             logging.error(e)
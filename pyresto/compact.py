@@ -0,0 +1,137 @@
+# coding: utf-8
+
+"""
+pyresto.compact
+~~~~~~~~~~~~~~~
+
+This module contains :class:`Record`, the compact, read-only representation
+of the items of a :class:`Many` relation created with ``compact=True``.
+Instead of a :class:`Model` instance with its own ``__dict__`` per item, a
+record holds a tuple of values and a reference to a key layout shared by all
+the records of the same model class with the same fields. The full
+:class:`Model` instance is only created when the record is modified or when
+anything other than its plain fields, such as a relation, is accessed.
+
+"""
+
+import threading
+
+__all__ = ('Record', 'compactor')
+
+_layouts = dict()
+_layouts_lock = threading.Lock()
+
+
+class _Layout(object):
+    __slots__ = ('model', 'keys', 'index')
+
+    def __init__(self, model, keys):
+        self.model = model
+        self.keys = keys
+        # the fields shadowed by class attributes, such as relations, are left
+        # to the materialised model
+        self.index = dict((key, position) for position, key in enumerate(keys)
+                          if key not in model.__dict__)
+
+
+def _layout(model, keys):
+    layout = _layouts.get((model, keys))
+    if layout is None:
+        with _layouts_lock:
+            keys = tuple(intern(key) if isinstance(key, str) else key
+                         for key in keys)
+            layout = _layouts.setdefault((model, keys), _Layout(model, keys))
+    return layout
+
+
+class Record(object):
+    """
+    A compact, read-only view of the data of a single :class:`Model`
+    instance. Its fields are available as attributes, just like the ones of
+    the model. Setting an attribute or accessing anything else materialises
+    the model, which is kept and used for everything afterwards.
+
+    """
+
+    __slots__ = ('_layout', '_values', '_factory', '_model', '__weakref__')
+
+    def __init__(self, layout, values, factory):
+        self._layout = layout
+        self._values = values
+        self._factory = factory
+        self._model = None
+
+    def _asdict(self):
+        """Returns the data of the record as a new dict."""
+        if self._model is not None:
+            return dict((key, value) for key, value
+                        in self._model.__dict__.iteritems()
+                        if not key.startswith('_') or key.startswith('__'))
+        return dict(zip(self._layout.keys, self._values))
+
+    def _get(self, name, default=None):
+        """
+        Returns the value of the field ``name`` as it was received, without
+        materialising the model.
+        """
+        if self._model is not None:
+            data = self._model.__dict__
+            return data.get(name, data.get('__' + name, default))
+        try:
+            return self._values[self._layout.keys.index(name)]
+        except ValueError:
+            return default
+
+    def _materialize(self):
+        """Returns the :class:`Model` instance of the record."""
+        if self._model is None:
+            self._model = self._factory(self._asdict())
+            self._values = None
+        return self._model
+
+    def __getattr__(self, name):
+        # only called for the names which are not slots or methods
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        if self._model is None:
+            index = self._layout.index.get(name)
+            if index is not None:
+                return self._values[index]
+        return getattr(self._materialize(), name)
+
+    def __setattr__(self, name, value):
+        if name in Record.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._materialize(), name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other._materialize()
+        return self._materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        if self._model is not None:
+            return repr(self._model)
+        return '<Record of {0} {1!r}>'.format(self._layout.model.__name__,
+                                             self._asdict())
+
+
+def compactor(model, factory):
+    """
+    Returns a wrapper function which turns the parsed item dicts of
+    ``model`` into :class:`Record` objects. ``factory`` is the wrapper which
+    creates the full :class:`Model` instance from a dict when a record is
+    materialised. Anything other than a dict is returned as it is.
+    """
+
+    def compact(data):
+        if isinstance(data, dict):
+            return Record(_layout(model, tuple(data)), tuple(data.itervalues()),
+                          factory)
+        return data
+
+    return compact
@@ -0,0 +1,205 @@
+# coding: utf-8
+
+"""
+pyresto.concurrency
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the small thread based helpers pyresto uses to issue
+several HTTP requests at once with a bounded number of workers.
+
+"""
+
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+__all__ = ('BatchResult', 'SingleFlight', 'imap_ordered', 'map_collect',
+           'submit', 'set_background_workers')
+
+_background_pool = None
+_background_workers = 10
+_background_lock = threading.Lock()
+
+
+def imap_ordered(func, items, concurrency):
+    """
+    A generator which applies ``func`` to every item in ``items`` using at
+    most ``concurrency`` threads and yields the results in the order of the
+    input. Any exception raised by ``func`` is re-raised when its result is
+    reached. Remaining work is cancelled when the generator is closed.
+
+    :param concurrency: The maximum number of calls running at once.
+    :type concurrency: int
+
+    """
+
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = ThreadPool(min(concurrency, len(items)))
+    try:
+        for result in pool.imap(func, items):
+            yield result
+    finally:
+        pool.terminate()
+
+
+class BatchResult(list):
+    """
+    The list of results of a batch operation, in the order of its input. Items
+    which failed are ``None`` in the list and their exceptions are available in
+    the :attr:`errors` dict under the index of the item.
+
+    """
+
+    def __init__(self, iterable=(), errors=None):
+        super(BatchResult, self).__init__(iterable)
+        self.errors = errors or dict()
+
+    @property
+    def ok(self):
+        """``True`` if none of the items failed."""
+        return not self.errors
+
+
+def map_collect(func, items, concurrency):
+    """
+    Applies ``func`` to every item in ``items`` just like :func:`imap_ordered`
+    but instead of stopping at the first failure, collects the exceptions of
+    the failed items.
+
+    :rtype: :class:`BatchResult`
+
+    """
+
+    def call(item):
+        try:
+            return func(item), None
+        except Exception, e:
+            return None, e
+
+    results = BatchResult()
+    for index, (value, error) in enumerate(imap_ordered(call, items,
+                                                        concurrency)):
+        results.append(value)
+        if error is not None:
+            results.errors[index] = error
+
+    return results
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: while a call is in flight,
+    other callers asking for the same key wait for it and receive its result,
+    or its exception, instead of making their own call. Nothing is kept once
+    the call returns.
+
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.__in_flight = dict()
+        self.__lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Calls ``func`` unless a call for ``key`` is already in flight.
+
+        :returns: A tuple of the result and a boolean telling if the result
+                  is shared with other callers, in which case it must be
+                  copied before being modified.
+        :rtype: tuple
+
+        """
+
+        with self.__lock:
+            self.calls += 1
+            call = self.__in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.__in_flight[key] = _Call()
+            else:
+                self.coalesced += 1
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self.__lock:
+                del self.__in_flight[key]
+            call.done.set()
+
+        # no one can join the call once it is out of __in_flight
+        return call.result, call.waiters > 0
+
+    def stats(self):
+        """
+        Returns a dict with the total number of ``calls`` and the number of
+        ``coalesced`` ones which did not cause a call of their own.
+        """
+        return dict(calls=self.calls, coalesced=self.coalesced)
+
+
+class _Call(object):
+    result = None
+    error = None
+    waiters = 0
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def set_background_workers(count):
+    """
+    Sets the number of threads used for the calls made through
+    :func:`submit`. Calls already submitted keep running on the old pool.
+
+    :param count: The number of worker threads.
+    :type count: int
+
+    """
+
+    global _background_pool, _background_workers
+    with _background_lock:
+        _background_workers = count
+        previous, _background_pool = _background_pool, None
+
+    if previous is not None:
+        previous.close()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Schedules ``func(*args, **kwargs)`` on the shared background thread pool
+    and returns immediately.
+
+    :returns: An object whose ``get(timeout=None)`` method blocks until the
+              call finishes and returns its result or re-raises its error.
+              ``ready()`` tells if the call is finished without blocking.
+    :rtype: :class:`multiprocessing.pool.AsyncResult`
+
+    """
+
+    global _background_pool
+    pool = _background_pool
+    if pool is None:
+        with _background_lock:
+            if _background_pool is None:
+                _background_pool = ThreadPool(_background_workers)
+            pool = _background_pool
+
+    return pool.apply_async(func, args, kwargs)
@@ -10,24 +10,92 @@ classes.
 """
 
 import collections
+import itertools
 import logging
+import threading
+import time
 import urlparse
-import requests
 from abc import ABCMeta, abstractproperty
+from contextlib import contextmanager
 from urllib import quote
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
+from requests.exceptions import ConnectionError, Timeout
 
+from auth import auth_identity
+from cache import CacheEntry
+from changes import UNCHANGED, merge_patch, snapshot
 from decorators import assert_class_instance, normalize_auth
-from exceptions import PyrestoInvalidOperationException, PyrestoServerResponseException, PyrestoInvalidRestMethodException
+from identity import bind_identity_map, current_identity_map
+from paths import compile_path
+import serialization
+from concurrency import (BatchResult, SingleFlight, imap_ordered,
+                         map_collect, submit)
+from transport import get_transport
+from exceptions import PyrestoInvalidOperationException, PyrestoServerResponseException, PyrestoInvalidRestMethodException, PyrestoImplicitFetchException
 
-__all__ = ('Model', 'Many', 'Foreign')
+__all__ = ('Model', 'Many', 'Foreign', 'no_implicit_fetch')
 
 ALLOWED_HTTP_METHODS = frozenset(('GET', 'POST', 'PUT', 'DELETE', 'PATCH'))
 
+#: The HTTP status codes of the failures which are worth retrying.
+TRANSIENT_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+
+
+def _is_transient(error):
+    if isinstance(error, PyrestoServerResponseException):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (ConnectionError, Timeout))
+
+#: The tuple type returned by :meth:`Model._rest_call`, holding the parsed
+#: ``data`` and the ``continuation_url`` if there is any.
+Result = collections.namedtuple('result', 'data continuation_url')
+
+
+def _copy_data(data):
+    # a deep copy of the parsed data shared between callers
+    if isinstance(data, dict):
+        return dict((key, _copy_data(value))
+                    for key, value in data.iteritems())
+    if isinstance(data, list):
+        return [_copy_data(item) for item in data]
+    return data
+
+
+def _hashable(value):
+    # turns query parameters into a key, keeping the order of sequences
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item))
+                            for key, item in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+_local = threading.local()
+
+
+@contextmanager
+def no_implicit_fetch():
+    """
+    A context manager which makes accessing a missing attribute of any
+    :class:`Model` instance raise
+    :exc:`~pyresto.exceptions.PyrestoImplicitFetchException` in the current
+    thread instead of fetching the instance. Use :meth:`Model.ensure_fetched`
+    to load the instances up front.
+
+    .. code-block:: python
+
+        with no_implicit_fetch():
+            for commit in repo.commits:
+                print commit.sha  # raises instead of making a request
+    """
+    previous = getattr(_local, 'strict', False)
+    _local.strict = True
+    try:
+        yield
+    finally:
+        _local.strict = previous
+
 
 class ModelBase(ABCMeta):
     """
@@ -50,6 +118,8 @@ class ModelBase(ABCMeta):
         if not isinstance(new_class._pk, tuple):  # make sure it is a tuple
             new_class._pk = (new_class._pk,)
 
+        compile_path(new_class._path)  # parse the template once, up front
+
         new_class.update = new_class.update_with_patch if \
             new_class._update_method == 'PATCH' else new_class.update_with_put
 
@@ -72,8 +142,16 @@ class Model(object):
 
     __pk_vals = None
 
+    __path = None
+
     __fetched_path = None
 
+    __fetched_at = None
+
+    __snapshot = None
+
+    __field_times = None
+
     _changed = None
 
     #: The class variable that holds the bae uel for the API endpoint for the
@@ -94,6 +172,32 @@ class Model(object):
     #: level for convenience.
     _auth = None
 
+    #: The class variable that holds the :class:`~pyresto.transport.Transport`
+    #: used to send the requests. Defaults to ``None`` which means the pooled
+    #: transport shared by all models on the same host as :attr:`_url_base`.
+    _transport = None
+
+    #: The class variable that holds the
+    #: :class:`~pyresto.ratelimit.RateLimiter` pacing the requests of the
+    #: model, used instead of the scheduler of its transport if set. Defaults
+    #: to ``None``.
+    _scheduler = None
+
+    #: The class variable that holds the :class:`~pyresto.cache.ResponseCache`
+    #: used for conditional GET requests. When set, responses carrying an
+    #: ``ETag`` or ``Last-Modified`` header are cached along with their body
+    #: and revalidated on the next request, parsing the cached body again if
+    #: the server responds with ``304 Not Modified``. Defaults to ``None``,
+    #: which disables caching.
+    _response_cache = None
+
+    #: The class variable that holds the
+    #: :class:`~pyresto.concurrency.SingleFlight` which makes concurrent GET
+    #: requests for the same URL, auth identity and parameters share a single
+    #: HTTP request and its parsed result. Shared by all models by default,
+    #: set to ``None`` to disable.
+    _single_flight = SingleFlight()
+
     @classmethod
     def _continuator(cls, response):
         """
@@ -112,19 +216,43 @@ class Model(object):
 
         return None
 
-    #: The class method which receives the class object and the body text of
-    #: the server response to be parsed. It is expected to return a
-    #: dictionary object having the properties of the related model. Defaults
-    #: to a "staticazed" version of :func:`json.loads` so it is not necessary
-    #: to override it if the response type is valid JSON.
-    _parser = staticmethod(json.loads)
+    #: The class variable that holds the maximum number of pages fetched at
+    #: once when :meth:`Model._page_urls` can tell the URLs of all the
+    #: remaining pages of a collection up front. Values lower than ``2``
+    #: disable the parallel fetching.
+    _fan_out = 0
+
+    @classmethod
+    def _page_urls(cls, continuation_url):
+        """
+        The class method which receives the continuation URL returned by
+        :meth:`Model._continuator` for the first page of a collection and
+        returns the list of URLs of all the remaining pages, in order, if they
+        can be determined without fetching them. The pages are then fetched
+        in parallel, using at most :attr:`Model._fan_out` requests at once.
+        The default implementation returns ``None``, which makes the pages to
+        be fetched one after another.
+
+        """
+
+        return None
+
+    #: The class method which receives the class object and the body of the
+    #: server response to be parsed, as bytes when it is UTF-8 encoded and as
+    #: text otherwise. It is expected to return a dictionary object having the
+    #: properties of the related model. Defaults to
+    #: :func:`pyresto.serialization.loads` which uses the fastest JSON backend
+    #: installed, so it is not necessary to override it if the response type
+    #: is valid JSON. Use :func:`pyresto.serialization.json_backend` to pick a
+    #: backend for a single model.
+    _parser = staticmethod(serialization.loads)
 
     #: The class method which receives the class object and a property dict of
     #: an instance to be serialized. It is expected to return a string which
     #: will be sent to the server on modification requests such as PATCH or
-    #: CREATE. Defaults to a "staticazed" version of :func:`json.loads` so it
-    #: is not necessary to override it if the response type is valid JSON.
-    _serializer = staticmethod(json.dumps)
+    #: CREATE. Defaults to :func:`pyresto.serialization.dumps` so it is not
+    #: necessary to override it if the request type is valid JSON.
+    _serializer = staticmethod(serialization.dumps)
 
     @abstractproperty
     def _pk(self):
@@ -136,13 +264,73 @@ class Model(object):
 
         """
 
-    #: The instance variable which is used to determine if the :class:`Model`
-    #: instance is filled from the server or not. It can be modified for
-    #: certain usages but this is not suggested. If :attr:`_fetched` is
-    #: ``False`` when an attribute, that is not in the class dictionary, tried
-    #: to be accessed, the :meth:`__fetch` method is called before raising an
-    #: :exc:`AttributeError`.
-    _fetched = False
+    @property
+    def _fetched(self):
+        """
+        The instance property which is used to determine if the :class:`Model`
+        instance is filled from the server or not. It can be modified for
+        certain usages but this is not suggested. If :attr:`_fetched` is
+        ``False`` when an attribute, that is not in the class dictionary, tried
+        to be accessed, the :meth:`__fetch` method is called before raising an
+        :exc:`AttributeError`. Setting it to ``True`` also records the time of
+        the fetch for :meth:`is_stale`.
+        """
+        return self.__fetched_at is not None
+
+    @_fetched.setter
+    def _fetched(self, value):
+        self.__fetched_at = self._time() if value else None
+        self.__field_times = None
+        if value:
+            self._take_snapshot()
+        else:
+            self.__snapshot = None
+
+    #: The class variable that holds the number of seconds the fetched data
+    #: of an instance is considered fresh, see :meth:`is_stale`. It can also
+    #: be a dict mapping field names to their own number of seconds, with the
+    #: ``None`` key holding the default. Defaults to ``None`` which means the
+    #: data never goes stale.
+    _ttl = None
+
+    #: The class variable which disables the implicit fetching of missing
+    #: attributes for the :class:`Model`, just like
+    #: :func:`no_implicit_fetch` does for the current thread.
+    _strict = False
+
+    _time = staticmethod(time.time)
+
+    #: The class variable that holds the default names of the fields fetched
+    #: by :meth:`Model.read`. Defaults to ``None`` which means all fields.
+    _fields = None
+
+    #: The instance variable which holds the names of the fields fetched for
+    #: an instance read with a field selection, ``None`` if all the fields
+    #: are fetched. Any other field is fetched individually on access.
+    _projection = None
+
+    @classmethod
+    def _project_path(cls, path, fields):
+        """
+        The class method which receives the path of a resource and the set of
+        field names requested from it, and returns a path that only fetches
+        those fields if the API supports it. The default implementation
+        returns the path as it is.
+
+        """
+
+        return path
+
+    @classmethod
+    def _project(cls, data, fields):
+        """
+        The class method which drops the fields that are not requested from the
+        parsed data of a resource, keeping the primary key fields.
+
+        """
+
+        return dict((key, value) for key, value in data.iteritems()
+                    if key in fields or key in cls._pk)
 
     #: The instance variable which holds the additional named get parameters
     #: provided to the :meth:`Model.get` to fetch the instance. It is used
@@ -186,36 +374,87 @@ class Model(object):
 
     @property
     def _pk_vals(self):
-        # if not self.__pk_vals:
-        #     if hasattr(self, '_pyresto_owner'):
-        #         self.__pk_vals = self. \
-        #                              _pyresto_owner._pk_vals[:len(self._pk) - 1] + (self._id,)
-        #     else:
-        #         self.__pk_vals = (None,) * (len(self._pk) - 1) + (self._id,)
-
-        # return self.__pk_vals
-        self.__pk_vals = (None,) * (len(self._pk) - 1) + (self._id,)
+        if not self.__pk_vals:
+            self.__pk_vals = (None,) * (len(self._pk) - 1) + (self._id,)
         return self.__pk_vals
 
     @_pk_vals.setter
     def _pk_vals(self, value):
         if len(value) == len(self._pk):
             self.__pk_vals = tuple(value)
+            self.__footprint = self.__path = None
         else:
             raise ValueError
 
+    def _update_pk(self, key, value):
+        """
+        Records the new ``value`` of the primary key field ``key`` in
+        :attr:`_pk_vals` and drops the cached footprint and path built from
+        the previous value.
+        """
+        if self.__pk_vals:
+            pk_vals = list(self.__pk_vals)
+            pk_vals[self._pk.index(key)] = value
+            self.__pk_vals = tuple(pk_vals)
+        self.__footprint = self.__path = None
+
+    @property
+    def _identity(self):
+        """
+        A property that returns the key identifying the resource in an
+        :class:`~pyresto.identity.IdentityMap`, or ``None`` if not all of its
+        primary key values are known.
+        """
+        pk_vals = self.__pk_vals or tuple(self.__dict__.get(key)
+                                          for key in self._pk)
+        if not pk_vals or None in pk_vals:
+            return None
+        return self.__class__, tuple(pk_vals)
+
+    def _merge(self, other):
+        """
+        Copies the data of ``other``, another instance of the same resource,
+        which this instance does not have yet. If only ``other`` is fetched,
+        its data replaces the unchanged data of this instance instead.
+        """
+        fresh = other._fetched and not self._fetched
+        merged = set()
+        for key, value in other.__dict__.iteritems():
+            # skip the internal attributes but not the relation keys
+            if key.startswith('_') and not key.startswith('__'):
+                continue
+            if key in self._changed:
+                continue
+            if fresh or key not in self.__dict__:
+                self.__dict__[key] = value
+                merged.add(key)
+
+        if fresh:
+            self._fetched = True
+        elif merged:
+            # the merged data comes from the server, it is not a change
+            self._take_snapshot(merged)
+
     @property
     def _footprint(self):
-        #if not self.__footprint:
-        self.__footprint = dict(zip(self._pk, self._pk_vals))
-        self.__footprint['self'] = self
+        footprint = self.__footprint
+        if footprint is None:
+            footprint = self.__footprint = dict(zip(self._pk, self._pk_vals))
+            footprint['self'] = self
 
-        return self.__footprint
+        return footprint
 
     @property
     def _current_path(self):
         if not self.__fetched_path:
-            return getattr(self._parent, '_current_path', "") + self._path.format(**self._footprint)
+            path = self.__path
+            if path is None:
+                format_path = compile_path(self._path)
+                path = format_path(self._footprint)
+                if not format_path.uses_self:
+                    # only depends on the primary key values, see _update_pk
+                    self.__path = path
+            return getattr(self._parent, '_current_path', "") + path
         else:
             return self.__fetched_path
 
@@ -224,56 +463,111 @@ class Model(object):
         return urlparse.urljoin(cls._url_base, url)
 
     @classmethod
-    def _rest_call(cls, url, method='GET', fetch_all=True, **kwargs):
-        """
-        A method which handles all the heavy HTTP stuff by itself. This is
-        actually a private method but to let the instances and derived classes
-        to call it, is made ``protected`` using only a single ``_`` prefix.
+    def _get_transport(cls):
+        return cls._transport or get_transport(cls._url_base)
 
-        All undocumented keyword arguments are passed to the HTTP request as
-        keyword arguments such as method, url etc.
+    @classmethod
+    def _cache_key(cls, url, kwargs):
+        return url, auth_identity(kwargs.get('auth')), \
+            _hashable(kwargs.get('params'))
 
-        :param fetch_all: (optional) Determines if the function should
-                          recursively fetch any "paginated" resource or simply
-                          return the downloaded and parsed data along with a
-                          continuation URL.
-        :type fetch_all: boolean
+    @classmethod
+    def _fetch_page(cls, url, method='GET', **kwargs):
+        """
+        Makes a single HTTP request and parses its response without following
+        any continuation URL. All keyword arguments are passed to the HTTP
+        request as they are.
 
-        :returns: Returns a tuple where the first part is the parsed data from
-                  the server using :attr:`Model._parser`, and the second half
-                  is the continuation URL extracted using
-                  :attr:`Model._continuator` or ``None`` if there isn't any.
-        :rtype: tuple
+        :returns: A :data:`Result` tuple holding the parsed data and the
+                  continuation URL, if there is any.
+        :rtype: :data:`Result`
 
         """
 
         url = cls._get_sanitized_url(url)
 
         if cls._auth is not None and 'auth' not in kwargs:
-            kwargs['auth'] = cls.auth
+            kwargs['auth'] = cls._auth
+
+        # a streamed body can only be read once, so it cannot be shared
+        if method == 'GET' and cls._single_flight is not None and \
+                kwargs.get('stream_path') is None:
+            key = (cls,) + cls._cache_key(url, kwargs)
+            result, shared = cls._single_flight.do(
+                key, lambda: cls._request(url, method, **kwargs))
+            if shared:
+                # every caller, including the one which made the request, gets
+                # its own copy, as the pages are merged into the returned data
+                result = Result(_copy_data(result.data),
+                                result.continuation_url)
+            return result
+
+        return cls._request(url, method, **kwargs)
+
+    @classmethod
+    def _request(cls, url, method, **kwargs):
+        """
+        Sends the request for :meth:`Model._fetch_page` to the sanitized
+        ``url``, going through the response cache if there is any, and parses
+        the response. When a ``stream_path`` keyword argument is given, the
+        data is a generator of the items found at that ijson prefix instead,
+        parsed while the response body is downloaded.
+        """
+
+        stream_path = kwargs.pop('stream_path', None)
+        if stream_path is not None:
+            kwargs['stream'] = True
+
+        cache = cls._response_cache if method == 'GET' and \
+            stream_path is None else None
+        cached = None
+        if cache is not None:
+            cache_key = cls._cache_key(url, kwargs)
+            cached = cache.get(cache_key)
+            if cached:
+                headers = dict(kwargs.get('headers') or ())
+                if cached.etag:
+                    headers['If-None-Match'] = cached.etag
+                if cached.last_modified:
+                    headers['If-Modified-Since'] = cached.last_modified
+                kwargs['headers'] = headers
 
         if method in ALLOWED_HTTP_METHODS:
-            response = requests.request(method.lower(), url, verify=True,
-                                        **kwargs)
+            response = cls._get_transport().request(
+                method.lower(), url, scheduler=cls._scheduler, **kwargs)
         else:
             raise PyrestoInvalidRestMethodException(
                 'Invalid method "{0:s}" is used for the HTTP request. Can only'
                 'use the following: {1!s}'.format(method,
                                                   ALLOWED_HTTP_METHODS))
 
-        result = collections.namedtuple('result', 'data continuation_url')
+        if cached and response.status_code == 304:
+            logging.debug('Not modified: %s', url)
+            # the cache keeps the body, every hit gets its own parsed data
+            # which callers can modify without touching the cache
+            data = cls._parser(cached.data) if cached.data else None
+            return Result(data, cached.continuation_url)
+
         if 200 <= response.status_code < 300:
             continuation_url = cls._continuator(response)
-            response_data = response.text
+            if stream_path is not None:
+                return Result(serialization.iter_items(response, stream_path),
+                              continuation_url)
+
+            response_data = serialization.response_body(response)
             data = cls._parser(response_data) if response_data else None
             if continuation_url:
                 logging.debug('Found more at: %s', continuation_url)
-                if fetch_all:
-                    kwargs['url'] = continuation_url
-                    data += cls._rest_call(**kwargs).data
-                else:
-                    return result(data, continuation_url)
-            return result(data, None)
+
+            if cache is not None:
+                etag = response.headers.get('etag')
+                last_modified = response.headers.get('last-modified')
+                if etag or last_modified:
+                    cache.set(cache_key, CacheEntry(
+                        etag, last_modified, response_data, continuation_url,
+                        len(response.content or '')))
+
+            return Result(data, continuation_url)
         else:
             msg = '%s returned HTTP %d: %s\nResponse\nHeaders: %s\nBody: %s'
             logging.error(msg, url, response.status_code, kwargs,
@@ -281,13 +575,128 @@ class Model(object):
 
             raise PyrestoServerResponseException('Server response not OK. '
                                                  'Response code: {0:d}'
-            .format(response.status_code))
+            .format(response.status_code), response.status_code)
+
+    @classmethod
+    def _iter_pages(cls, url, method='GET', **kwargs):
+        """
+        A generator which fetches a paginated resource page by page, following
+        the continuation URLs returned by :meth:`Model._continuator`, and yields
+        the parsed data of each page as soon as it is downloaded. Only one page
+        is held in memory at a time and the same ``method`` and keyword
+        arguments are used for every page. When :meth:`Model._page_urls` knows
+        the URLs of the remaining pages, they are fetched in parallel and
+        yielded in order.
+
+        """
+
+        data, url = cls._fetch_page(url, method, **kwargs)
+        yield data
 
-    def __fetch(self):
-        data, next_url = self._rest_call(url=self._current_path,
-                                         auth=self._auth)
+        for data in cls._iter_next_pages(url, method, **kwargs):
+            yield data
+
+    @classmethod
+    def _iter_next_pages(cls, url, method='GET', **kwargs):
+        # the pages from the continuation URL ``url`` on, see _iter_pages
+
+        # streamed pages are not fanned out, their bodies would all be held
+        # open until they are consumed
+        urls = cls._page_urls(url) if url and cls._fan_out > 1 and \
+            kwargs.get('stream_path') is None else None
+        if urls:
+            fetch = lambda page_url: cls._fetch_page(page_url, method,
+                                                     **kwargs)[0]
+            for data in imap_ordered(fetch, urls, cls._fan_out):
+                yield data
+            return
+
+        while url:
+            data, url = cls._fetch_page(url, method, **kwargs)
+            yield data
+
+    @classmethod
+    def _rest_call(cls, url, method='GET', fetch_all=True, **kwargs):
+        """
+        A method which handles all the heavy HTTP stuff by itself. This is
+        actually a private method but to let the instances and derived classes
+        to call it, is made ``protected`` using only a single ``_`` prefix.
+
+        All undocumented keyword arguments are passed to the HTTP request as
+        keyword arguments such as method, url etc.
+
+        :param fetch_all: (optional) Determines if the function should
+                          fetch all the pages of any "paginated" resource
+                          using :meth:`Model._iter_pages` or simply return the
+                          downloaded and parsed data along with a continuation
+                          URL. Only the pages of ``GET`` requests whose data
+                          is a list are followed, the continuation URL is
+                          returned for the others.
+        :type fetch_all: boolean
+
+        :param stream_path: (optional) The ijson prefix of the items to parse
+                            from the response while it is downloaded, such as
+                            ``'item'`` for a top level array. The returned data
+                            is then a generator of these items, chaining all
+                            the pages if ``fetch_all`` is set. Needs the
+                            optional ``ijson`` package.
+        :type stream_path: string
+
+        :returns: Returns a tuple where the first part is the parsed data from
+                  the server using :attr:`Model._parser`, and the second half
+                  is the continuation URL extracted using
+                  :attr:`Model._continuator` or ``None`` if there isn't any.
+        :rtype: tuple
+
+        """
+
+        data, next_url = cls._fetch_page(url, method, **kwargs)
+        if not fetch_all or not next_url:
+            return Result(data, next_url)
+        if method != 'GET':
+            # following the pages would send the request body again
+            logging.warning('Not following the pages of %s %s', method, url)
+            return Result(data, next_url)
+
+        pages = cls._iter_next_pages(next_url, method, **kwargs)
+        if kwargs.get('stream_path') is not None:
+            # the rest of the pages are requested as the items are consumed
+            return Result(itertools.chain(data,
+                                          itertools.chain.from_iterable(pages)),
+                          None)
+        elif isinstance(data, list):
+            # extend the first page in place instead of concatenating lists
+            # to keep the accumulation linear in the collection size
+            for page in pages:
+                if page:
+                    data.extend(page)
+        else:
+            logging.warning('Ignoring the pages after the first one of %s, '
+                            'its data is not a list', url)
+            return Result(data, next_url)
+
+        return Result(data, None)
+
+    def __fetch(self, fields=None):
+        path = self._current_path
+        if fields:
+            projected_path = self._project_path(path, fields)
+            partial = projected_path != path
+        else:
+            projected_path, partial = path, False
+
+        data, next_url = self._rest_call(url=projected_path, auth=self._auth)
+
+        if partial:
+            if self._projection is not None:
+                self._projection = self._projection | frozenset(fields)
+        else:
+            self._projection = None
 
         if data:
+            # keep the changes which are not saved yet
+            changed = dict((key, self.__dict__[key]) for key in self._changed
+                           if key in self.__dict__)
             self.__dict__.update(data)
 
             cls = self.__class__
@@ -297,17 +706,171 @@ class Model(object):
                 if issubclass(getattr(cls, item), Model):
                     self.__dict__['__' + item] = self.__dict__.pop(item)
 
-            self._fetched = True
+            self.__dict__.update(changed)
+
+            if not partial or not self._fetched:
+                self._fetched = True
+            else:
+                self._take_snapshot(fields)
+            if partial:
+                field_times = self.__field_times = self.__field_times or dict()
+                field_times.update(dict.fromkeys(fields, self._time()))
+
+    def _take_snapshot(self, fields=None):
+        """
+        Records the current state of the given fields, or of all the fields,
+        as the state known to the server. :meth:`Model._changes` compares
+        with it. Fields with unsaved changes are left out.
+        """
+        data = self.__dict__
+        if fields is None:
+            fields = data
+            snapshots = self.__snapshot = dict()
+        else:
+            snapshots = self.__snapshot
+            if snapshots is None:
+                return  # nothing to add the fields to
+
+        changed = self._changed or ()
+        for key in fields:
+            if key in data and not key.startswith('_') and \
+                    key not in changed:
+                snapshots[key] = snapshot(data[key])
+
+    def _changes(self, keys=None):
+        """
+        Returns the smallest JSON merge patch with the changes of the
+        instance, or of only the given fields, since it was fetched or saved.
+        Changes made in place inside nested objects and lists are included.
+        The fields set on the instance are always included, and they are the
+        only ones for instances which were never fetched.
+
+        :rtype: dict
+        """
+
+        data = self.__dict__
+        changed = self._changed & set(keys) if keys else self._changed
+        patch = dict((key, data[key]) for key in changed if key in data)
+        snapshots = self.__snapshot
+        if snapshots is None:
+            return patch
+
+        if keys is None:
+            keys = set(key for key in data if not key.startswith('_'))
+            keys.update(snapshots)
+
+        for key in keys:
+            if key in patch:
+                continue
+            previous = snapshots.get(key)
+            if key not in data:
+                if previous is not None:
+                    patch[key] = None
+            elif previous is None:
+                patch[key] = data[key]
+            else:
+                value = merge_patch(data[key], previous)
+                if value is not UNCHANGED:
+                    patch[key] = value
+
+        return patch
+
+    def __fetch_implicitly(self, name, fields=None):
+        if self._strict or getattr(_local, 'strict', False):
+            raise PyrestoImplicitFetchException(
+                'Accessing {0!r} of {1!r} needs a request, which is disabled. '
+                'Use ensure_fetched() first.'.format(name, self))
+        self.__fetch(fields=fields)
+
+    def is_stale(self, field=None):
+        """
+        Tells if the data of the instance, or of the given field, is older
+        than :attr:`Model._ttl` allows. Instances which are not fetched yet
+        are always stale.
+
+        :param field: (optional) The name of the field to check.
+        :type field: string
+
+        :rtype: boolean
+        """
+
+        if not self._fetched:
+            return True
+
+        ttl = self._ttl
+        if isinstance(ttl, dict):
+            ttl = ttl.get(field, ttl.get(None))
+        if ttl is None:
+            return False
+
+        fetched_at = (self.__field_times or {}).get(field, self.__fetched_at)
+        return self._time() - fetched_at > ttl
+
+    def refresh(self, *fields):
+        """
+        Fetches the instance again, or only the given fields of it if the API
+        supports fetching a selection of fields, regardless of its staleness.
+        Changes which are not saved yet are kept.
+
+        :returns: The instance itself.
+        """
+
+        # a partial instance cannot be refreshed by fields, everything else
+        # would be considered fetched afterwards
+        self.__fetch(fields=fields if self._fetched else None)
+        return self
+
+    def ensure_fetched(self, *fields):
+        """
+        Fetches the instance unless it is fetched already and it is not stale.
+        When fields are given, only the missing or stale ones are fetched.
+        Meant to load the data up front, before accessing the instance in
+        :func:`no_implicit_fetch` mode.
+
+        :returns: The instance itself.
+        """
+
+        if not self._fetched:
+            self.__fetch()
+        elif fields:
+            projection = self._projection
+            outdated = [field for field in fields if self.is_stale(field) or
+                        projection is not None and field not in projection]
+            if outdated:
+                self.__fetch(fields=outdated)
+        elif self.is_stale():
+            self.__fetch()
+
+        return self
 
     def __getattr__(self, name):
-        if self._fetched:  # if we fetched and still don't have it, no luck!
-            raise AttributeError
-        self.__fetch()
-        return getattr(self, name)  # try again after fetching
+        if name.startswith('__') and name.endswith('__'):
+            # protocol probes such as __len__ are never resource fields
+            raise AttributeError(name)
+        if self._projection is not None:
+            # fetch the fields left out by the projection of Model.read, the
+            # relation fields are stored with a "__" prefix
+            field = name[2:] if name.startswith('__') else name
+            if not field.startswith('_') and field not in self._projection:
+                self.__fetch_implicitly(name, fields=(field,))
+                return self.__fetched_value(name)
+        # if we fetched and still don't have it, no luck!
+        if self._fetched and not self.is_stale(name):
+            raise AttributeError(name)
+        self.__fetch_implicitly(name)
+        return self.__fetched_value(name)  # try again after fetching
+
+    def __fetched_value(self, name):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(name)
 
     def __setattr__(self, key, value):
         if not key.startswith('_'):
             self._changed.add(key)
+            if key in self._pk:
+                self._update_pk(key, value)
         super(Model, self).__setattr__(key, value)
 
     def __delattr__(self, item):
@@ -336,11 +899,23 @@ class Model(object):
         :param pk: The primary key value for the requested resource.
         :type pk: string
 
+        :param fields: (optional) The names of the fields to fetch, defaults
+                       to :attr:`Model._fields`. Other fields are fetched
+                       separately when they are accessed.
+        :type fields: tuple or None
+
         :rtype: :class:`Model` or None
 
         """
 
         auth = kwargs.pop('auth', cls._auth)
+        fields = kwargs.pop('fields', cls._fields)
+
+        identities = current_identity_map()
+        if identities is not None:
+            known = identities.get(cls, args)
+            if known is not None and known._fetched:
+                return known
 
         ids = dict(zip(cls._pk, args))
         parent = kwargs.pop('parent', None)
@@ -349,8 +924,16 @@ class Model(object):
         if 'path' in kwargs:
             path = kwargs.pop('path')
         else:
-            path = getattr(parent, '_current_path', "") + cls._path.format(**ids)
-        data = cls._rest_call(url=path, auth=auth).data
+            path = getattr(parent, '_current_path', "") + \
+                compile_path(cls._path)(ids)
+
+        if fields:
+            fields = frozenset(fields)
+            data = cls._rest_call(url=cls._project_path(path, fields),
+                                  auth=auth).data
+            data = data and cls._project(data, fields)
+        else:
+            data = cls._rest_call(url=path, auth=auth).data
 
         if not data:
             return None
@@ -358,27 +941,203 @@ class Model(object):
         instance = cls(parent=parent, **data)
         instance._pk_vals = args
         instance._fetched = True
+        if fields:
+            instance._projection = fields
         instance.__fetched_path = path
         if auth:
             instance._auth = auth
 
+        if identities is not None:
+            instance = identities.add(instance)
+
         return instance
 
+    @classmethod
+    def read_many(cls, keys, concurrency=8, **kwargs):
+        """
+        The class method that fetches and instantiates many resources at once,
+        using at most ``concurrency`` parallel requests. Identical keys are
+        only fetched once. Any other keyword arguments are passed to
+        :meth:`Model.read` for every key.
+
+        :param keys: The primary key values for the requested resources. Each
+                     key is either a tuple of values, as would be passed to
+                     :meth:`Model.read`, or a single value.
+        :type keys: iterable
+
+        :returns: The instances in the order of ``keys``. Failed reads are
+                  ``None`` and their errors are collected in
+                  :attr:`BatchResult.errors` instead of aborting the batch.
+        :rtype: :class:`~pyresto.concurrency.BatchResult`
+
+        """
+
+        keys = [key if isinstance(key, tuple) else (key,) for key in keys]
+
+        unique_keys = list()
+        positions = dict()
+        for key in keys:
+            if key not in positions:
+                positions[key] = len(unique_keys)
+                unique_keys.append(key)
+
+        read = bind_identity_map(cls.read)
+        fetched = map_collect(lambda key: read(*key, **kwargs),
+                              unique_keys, concurrency)
+
+        results = BatchResult()
+        for index, key in enumerate(keys):
+            position = positions[key]
+            results.append(fetched[position])
+            if position in fetched.errors:
+                results.errors[index] = fetched.errors[position]
+
+        return results
+
+    @classmethod
+    def aread(cls, *args, **kwargs):
+        """
+        The non-blocking version of :meth:`Model.read`. The request is made on
+        a background thread over the same pooled transport and the call
+        returns immediately.
+
+        :returns: An asynchronous result whose ``get()`` method returns what
+                  :meth:`Model.read` would have returned.
+        :rtype: :class:`multiprocessing.pool.AsyncResult`
+
+        """
+
+        return submit(bind_identity_map(cls.read), *args, **kwargs)
+
+    @classmethod
+    def aupdate(cls, instance, **kwargs):
+        """The non-blocking version of :meth:`Model.update`."""
+        return submit(cls.update, instance, **kwargs)
+
+    @classmethod
+    def adelete(cls, instance, **kwargs):
+        """The non-blocking version of :meth:`Model.delete`."""
+        return submit(cls.delete, instance, **kwargs)
+
+    #: The class variable that holds the number of seconds to wait before
+    #: the first retry of a request which failed with a transient error in
+    #: :meth:`Model.bulk_update` and :meth:`Model.bulk_delete`. The wait is
+    #: doubled for every further retry.
+    _retry_backoff = 0.5
+
+    _sleep = staticmethod(time.sleep)
+
+    @classmethod
+    def _with_retries(cls, func, retries):
+        """
+        Calls ``func`` with the number of the attempt, starting from 0, and
+        calls it again up to ``retries`` times as long as it fails with a
+        transient error such as a connection error or an HTTP 503 response.
+        """
+
+        attempt = 0
+        while True:
+            try:
+                return func(attempt)
+            except Exception, e:
+                if attempt >= retries or not _is_transient(e):
+                    raise
+
+                delay = cls._retry_backoff * 2 ** attempt
+                logging.warning('Retrying in %.2fs after: %s', delay, e)
+                cls._sleep(delay)
+                attempt += 1
+
+    @classmethod
+    def bulk_update(cls, instances, keys=None, concurrency=8, retries=2,
+                    **kwargs):
+        """
+        Updates many instances at once, sending at most ``concurrency``
+        requests in parallel over the pooled transport. Only the instances
+        with changes, to any of ``keys`` if given, are sent. Requests which
+        fail with a transient error are retried up to ``retries`` times. Any
+        other keyword arguments are passed to :meth:`Model.update`.
+
+        .. code-block:: python
+
+            for issue in issues:
+                issue.labels = ['triaged']
+            results = Issue.bulk_update(issues, concurrency=16)
+            for index, error in results.errors.iteritems():
+                print issues[index], error
+
+        :param keys: (optional) The names of the fields to send, only used
+                     with the ``PATCH`` update method.
+        :type keys: set
+
+        :returns: The instances in the order of ``instances``. Failed updates
+                  are ``None`` and their errors are collected in
+                  :attr:`BatchResult.errors` instead of aborting the batch.
+        :rtype: :class:`~pyresto.concurrency.BatchResult`
+
+        """
+
+        keys = frozenset(keys) if keys else None
+        patch = cls._update_method == 'PATCH'
+
+        def update(instance):
+            if not instance._changes(keys):
+                return instance
+            if patch and keys:
+                call = lambda attempt: cls.update(instance, keys=keys,
+                                                  **kwargs)
+            else:
+                call = lambda attempt: cls.update(instance, **kwargs)
+            return cls._with_retries(call, retries)
+
+        return map_collect(bind_identity_map(update), instances, concurrency)
+
+    @classmethod
+    def bulk_delete(cls, instances, concurrency=8, retries=2, **kwargs):
+        """
+        Deletes many instances at once, sending at most ``concurrency``
+        requests in parallel over the pooled transport. Requests which fail
+        with a transient error are retried up to ``retries`` times and a
+        retried request finding the resource already gone counts as deleted.
+        Any other keyword arguments are passed to :meth:`Model.delete`.
+
+        :returns: ``True`` for every deleted instance, in the order of
+                  ``instances``. Failed deletions are ``None`` and their
+                  errors are collected in :attr:`BatchResult.errors`.
+        :rtype: :class:`~pyresto.concurrency.BatchResult`
+
+        """
+
+        def delete(instance):
+            def call(attempt):
+                try:
+                    return cls.delete(instance, **kwargs)
+                except PyrestoServerResponseException, e:
+                    # the previous attempt went through after all
+                    if attempt and e.status_code == 404:
+                        return True
+                    raise
+
+            return cls._with_retries(call, retries)
+
+        return map_collect(delete, instances, concurrency)
+
     @classmethod
     @normalize_auth
     @assert_class_instance
     def update_with_patch(cls, instance, keys=None, auth=None):
-        if keys:
-            keys &= instance._changed
+        data = instance._changes(keys)
+        if data:
+            path = instance._current_path
+            resp = cls._rest_call(method="PATCH", url=path, auth=auth,
+                                  data=cls._serializer(data)).data
+            if resp:
+                instance.__dict__.update(resp)
         else:
-            keys = instance._changed
+            resp = None  # nothing to send
 
-        data = dict((key, instance.__dict__[key]) for key in keys)
-        path = instance._current_path
-        resp = cls._rest_call(method="PATCH", url=path, auth=auth,
-                              data=cls._serializer(data)).data
-        instance.__dict__.update(resp)
-        instance._changed -= keys
+        instance._changed -= set(keys) if keys else set(instance._changed)
+        instance._take_snapshot(set(data) | set(resp or ()))
 
         return instance
 
@@ -386,12 +1145,23 @@ class Model(object):
     @normalize_auth
     @assert_class_instance
     def update_with_put(cls, instance, auth=None):
-        data = instance.__dict__.copy()
+        # without a snapshot there is no telling what the server has
+        if instance.__snapshot is not None and not instance._changes():
+            return instance
+
+        # only the resource fields, the relation fields are stored with a
+        # "__" prefix
+        data = dict((key[2:] if key.startswith('__') else key, value)
+                    for key, value in instance.__dict__.iteritems()
+                    if not key.startswith('_') or key.startswith('__') and
+                    key[2:] in instance.__class__.__dict__)
         path = instance._current_path
         resp = cls._rest_call(method="PUT", url=path, auth=auth,
                               data=cls._serializer(data)).data
-        instance.__dict__.update(resp)
+        if resp:
+            instance.__dict__.update(resp)
         instance._changed.clear()
+        instance._take_snapshot()
 
         return instance
 
@@ -1,6 +1,7 @@
 __all__ = ('PyrestoException','PyrestoInvalidOperationException',
            'PyrestoServerResponseException','PyrestoInvalidRestMethodException',
-           'PyrestoInvalidAuthTypeException', )
+           'PyrestoInvalidAuthTypeException',
+           'PyrestoImplicitFetchException', )
 
 
 class PyrestoException(Exception):
@@ -12,7 +13,14 @@ class PyrestoInvalidOperationException(PyrestoException):
 
 
 class PyrestoServerResponseException(PyrestoException):
-    """Server response error class for pyresto."""
+    """
+    Server response error class for pyresto. The HTTP status code of the
+    response is available as :attr:`status_code`.
+    """
+
+    def __init__(self, message, status_code=None):
+        super(PyrestoServerResponseException, self).__init__(message)
+        self.status_code = status_code
 
 
 class PyrestoInvalidRestMethodException(PyrestoException, ValueError):
@@ -24,3 +32,11 @@ class PyrestoInvalidAuthTypeException(PyrestoException, ValueError):
     Error class for exceptions thrown when an invalid auth type is used with
     the global authentication function generated by :func:`enable_auth`
     """
+
+
+class PyrestoImplicitFetchException(PyrestoException, AttributeError):
+    """
+    Error class for exceptions thrown when an attribute of a :class:`Model`
+    is accessed which could only be loaded with a request while implicit
+    fetching is disabled, see :func:`~pyresto.core.no_implicit_fetch`.
+    """
@@ -0,0 +1,112 @@
+# coding: utf-8
+
+"""
+pyresto.identity
+~~~~~~~~~~~~~~~~
+
+This module contains the :class:`IdentityMap` which makes every resource
+represented by a single :class:`Model` instance while it is active, no matter
+how many times it is read or referenced through relations.
+
+.. code-block:: python
+
+    with IdentityMap():
+        for commit in repo.commits:
+            print commit.author.name  # each author is fetched only once
+
+"""
+
+import threading
+
+__all__ = ('IdentityMap', 'current_identity_map', 'bind_identity_map')
+
+_local = threading.local()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = list()
+    return stack
+
+
+def current_identity_map():
+    """
+    Returns the innermost active :class:`IdentityMap` of the current thread
+    or ``None`` if there isn't any.
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def bind_identity_map(func):
+    """
+    Returns a wrapper around ``func`` which runs it with the identity map
+    active at the time of this call. Used to carry the identity map over to
+    worker threads.
+    """
+    identities = current_identity_map()
+    if identities is None:
+        return func
+
+    def bound(*args, **kwargs):
+        with identities:
+            return func(*args, **kwargs)
+
+    return bound
+
+
+class IdentityMap(object):
+    """
+    A registry of :class:`Model` instances keyed by their class and primary
+    key values. It is activated for the current thread using the ``with``
+    statement and consulted by :meth:`Model.read`, :class:`Many` and
+    :class:`Foreign` to hand out the already known instance of a resource
+    instead of creating a new one. Only instances with all their primary key
+    values known are registered.
+
+    """
+
+    def __init__(self):
+        self.__instances = dict()
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack().pop()
+
+    def __len__(self):
+        return len(self.__instances)
+
+    def get(self, model, pk_vals):
+        """
+        Returns the registered instance of ``model`` with the given primary
+        key values or ``None``.
+        """
+        return self.__instances.get((model, tuple(pk_vals)))
+
+    def add(self, instance):
+        """
+        Registers ``instance`` and returns it. If there is already an instance
+        for the same resource, the data of ``instance`` is merged into it and
+        the registered instance is returned instead.
+        """
+        key = instance._identity
+        if key is None:
+            return instance
+
+        with self.__lock:
+            existing = self.__instances.setdefault(key, instance)
+
+        if existing is not instance:
+            existing._merge(instance)
+
+        return existing
+
+    def clear(self):
+        """Forgets all the registered instances."""
+        with self.__lock:
+            self.__instances.clear()
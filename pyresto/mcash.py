@@ -1,4 +1,7 @@
+from concurrency import BatchResult, map_collect
 from core import Model
+from identity import bind_identity_map
+from paths import compile_path
 from wtforms.form import Form
 from wtforms import fields
 
@@ -43,12 +46,45 @@ class McashModel(Model):
             if issubclass(getattr(cls, item), Model):
                 self.__data.__dict__['__' + item] = self.__data.__dict__.pop(item)
 
+        # The form is built once and kept up to date field by field, only the
+        # given fields are validated here, the whole form on save()
         self.__form = cls.Form(obj=self.__data)
-        if not self.__form.validate():
-            raise ValueError  # TODO: raise more valuable info about Error
+        for key in kwargs:
+            self.__validate_field(key)
 
         self._changed = set(kwargs.keys())
 
+    def __validate_field(self, name):
+        # Runs the validators of a single field, including the inline
+        # validate_<name> method of the form, like Form.validate would
+        form = self.__form
+        if name not in form:
+            return
+        field = form[name]
+        inline = getattr(form.__class__, 'validate_' + name, None)
+        if not field.validate(form, (inline,) if inline else ()):
+            raise ValueError('{0}: {1}'.format(name, '; '.join(
+                unicode(error) for error in field.errors)))
+
+    def __update_form(self, data, validate=True):
+        # Processes, and validates, the fields which got new values
+        for key, value in data.iteritems():
+            if key in self.__form:
+                self.__form[key].process(None, value)
+                if validate:
+                    self.__validate_field(key)
+
+    def validate(self):
+        """
+        Validates the whole form of the model, which is also done by
+        :meth:`save`. Assigning a field only validates that field.
+
+        :raises ValueError: If the form is not valid.
+        """
+        if not self.__form.validate():
+            raise ValueError(self.__form.errors)
+        return True
+
     def __fetch(self):
         # Overriden __fetch
         # Original used self.__dict__ to store the data
@@ -67,6 +103,8 @@ class McashModel(Model):
                 if issubclass(getattr(cls, item), Model):
                     self.__data.__dict__['__' + item] = self.__data.__dict__.pop(item)
 
+            # keep the form in sync, fetched data is not validated
+            self.__update_form(data, validate=False)
             self._fetched = True
 
     def __getattr__(self, name):
@@ -88,17 +126,16 @@ class McashModel(Model):
                         if getattr(self.__data, key, None):
                             raise AttributeError('%s field can be set only once. Changing the value is not allowed' % key)
                 self._changed.add(key)
+                if key in self._pk:
+                    self._update_pk(key, value)
                 setattr(self.__data, key, value)
-                self.__form = self.__class__.Form(obj=self.__data)
-                if not self.__form.validate():
-                    raise ValueError  # TODO: raise more valuable info about Error
-                else:
-                    return
+                self.__update_form({key: value})
+                return
         super(Model, self).__setattr__(key, value)
 
     @property
     def _current_list_path(self):
-        return getattr(self._parent, '_current_path', "") + self._list_path.format(**self._footprint)
+        return getattr(self._parent, '_current_path', "") + compile_path(self._list_path)(self._footprint)
 
     def _do_post(self, data={}, *args, **kwargs):
         path = self._current_list_path
@@ -133,6 +170,11 @@ class McashModel(Model):
             other way uses PUT request.
             Doesn't support PATCH for now (we just don't need it)
         """
+        self.validate()
+        return self.__save(*args, **kwargs)
+
+    def __save(self, *args, **kwargs):
+        # save() of an already validated instance
         # Form contains all user entered data
         # But something probably will be in Relations
         # We want all the data in the same place
@@ -161,19 +203,74 @@ class McashModel(Model):
             resp = self._do_put(data=data, *args, **kwargs)
 
         # Update data object with data from response
-        # And revalidate form
+        # And revalidate the fields we got back
         # raise and Error if we got something that wouldn't
         # like to get
         self.__data.__dict__.update(resp)
-        self.__form = self.__class__.Form(obj=self.__data)
-        if not self.__form.validate():
-            raise ValueError  # TODO: raise more valuable info about Error
+        self.__update_form(resp)
 
         self._pk_vals = [getattr(self, key) for key in self._pk]
 
         self._changed.clear()
         return self
 
+    @classmethod
+    def save_many(cls, instances, concurrency=8, **kwargs):
+        """
+        Saves many instances at once, sending at most ``concurrency``
+        requests in parallel over the pooled transport, so creating thousands
+        of POS entries under a merchant takes about as long as ``count /
+        concurrency`` single saves. All the instances are validated before
+        anything is sent and the invalid ones are reported as failures
+        without being sent. The rest are sent ordered by the collection they
+        are created in, all sharing the ``concurrency`` limit, and each
+        response is merged back into its instance just like :meth:`save`
+        does. Any other keyword arguments are passed to :meth:`save`.
+
+        Creating with ``POST`` is not idempotent, so failed requests are not
+        retried.
+
+        .. code-block:: python
+
+            results = POS.save_many(entries, concurrency=16)
+            for index, error in results.errors.iteritems():
+                print entries[index], error
+
+        :returns: The instances in the order of ``instances``. Failed saves
+                  are ``None`` and their errors are collected in
+                  :attr:`BatchResult.errors` instead of aborting the batch.
+        :rtype: :class:`~pyresto.concurrency.BatchResult`
+        """
+
+        instances = list(instances)
+        results = BatchResult([None] * len(instances))
+
+        paths = list()
+        groups = dict()
+        for index, instance in enumerate(instances):
+            try:
+                instance.validate()
+                path = instance._list_path and instance._current_list_path
+            except Exception, e:
+                results.errors[index] = e
+                continue
+            if path not in groups:
+                paths.append(path)
+                groups[path] = list()
+            groups[path].append(index)
+
+        # a single pool for all the groups, which only order the requests
+        indexes = [index for group in paths for index in groups[group]]
+        save = bind_identity_map(
+            lambda index: instances[index].__save(**kwargs))
+        saved = map_collect(save, indexes, concurrency)
+        for position, index in enumerate(indexes):
+            results[index] = saved[position]
+        for position, error in saved.errors.iteritems():
+            results.errors[indexes[position]] = error
+
+        return results
+
     def remove(self):
         """
             Does DELETE request on resource Url
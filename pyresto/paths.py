@@ -0,0 +1,84 @@
+# coding: utf-8
+
+"""
+pyresto.paths
+~~~~~~~~~~~~~
+
+This module contains :func:`compile_path` which turns the path templates of
+models and relations, such as ``/repos/{user}/{repo}``, into formatter
+functions. The templates are parsed once instead of on every
+:meth:`str.format` call.
+
+"""
+
+import operator
+import re
+import string
+import threading
+
+__all__ = ('compile_path',)
+
+_name_re = re.compile(r'[A-Za-z_]\w*$')
+
+_compiled = dict()
+_compiled_lock = threading.Lock()
+
+
+def _compile(template):
+    parts = list()
+    names = list()
+    uses_self = False
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace('%', '%%'))
+        if field is None:
+            continue
+
+        uses_self = uses_self or field.partition('.')[0] == 'self'
+        if spec or conversion or not _name_re.match(field):
+            # leave the attributes, indexes and format specs to str.format
+            format_path = lambda footprint: template.format(**footprint)
+            format_path.uses_self = uses_self or 'self' in template
+            return format_path
+
+        parts.append('%s')
+        names.append(field)
+
+    # a %-format string and a C level getter for its arguments, which is much
+    # faster than parsing the template on every str.format call
+    percent_template = template[:0].join(parts)
+    if not names:
+        path = percent_template % ()
+        format_path = lambda footprint: path
+    elif len(names) == 1:
+        name = names[0]
+        format_path = lambda footprint: percent_template % (footprint[name],)
+    else:
+        getter = operator.itemgetter(*names)
+        format_path = lambda footprint: percent_template % getter(footprint)
+
+    format_path.uses_self = uses_self
+    return format_path
+
+
+def compile_path(template):
+    """
+    Returns a function which formats ``template`` with a footprint dict, just
+    like ``template.format(**footprint)``. The functions are cached per
+    template. Their ``uses_self`` attribute tells if the template refers to
+    the ``self`` key, which makes the result depend on more than the primary
+    key values.
+
+    :param template: A path template using the :meth:`str.format` notation.
+    :type template: string
+
+    :rtype: function
+    """
+
+    key = type(template), template  # u'/a' and '/a' format differently
+    format_path = _compiled.get(key)
+    if format_path is None:
+        with _compiled_lock:
+            format_path = _compiled.get(key)
+            if format_path is None:
+                format_path = _compiled[key] = _compile(template)
+    return format_path
@@ -0,0 +1,226 @@
+# coding: utf-8
+
+"""
+pyresto.ratelimit
+~~~~~~~~~~~~~~~~~
+
+This module contains the :class:`RateLimiter` which a
+:class:`~pyresto.transport.Transport` uses to pace its requests according to
+the ``X-RateLimit-*`` and ``Retry-After`` headers sent by the server, and to
+wait and retry instead of failing when the limit is hit anyway.
+
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from auth import auth_identity
+
+__all__ = ('RateLimiter', 'INTERACTIVE', 'BACKGROUND', 'priority',
+           'current_priority')
+
+#: The priority of the requests made by default. They are only held back
+#: when the rate limit is used up.
+INTERACTIVE = 'interactive'
+
+#: The priority of bulk work such as crawls. These requests are spread evenly
+#: over the rate limit window and leave a reserve to interactive requests.
+BACKGROUND = 'background'
+
+_local = threading.local()
+
+
+def current_priority():
+    """Returns the request priority of the current thread."""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextmanager
+def priority(value):
+    """
+    A context manager which sets the priority of the requests made by the
+    current thread.
+
+    .. code-block:: python
+
+        with priority(BACKGROUND):
+            for commit in repo.commits:
+                ...
+
+    """
+    previous = current_priority()
+    _local.priority = value
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class _Budget(object):
+    limit = None
+    remaining = None
+    reset = None
+    next_slot = 0
+
+
+class RateLimiter(object):
+    """
+    Tracks the remaining rate limit of every authentication identity from the
+    response headers and delays the requests which would exceed it.
+
+    """
+
+    def __init__(self, reserve=0.1, max_retries=3, max_wait=3600):
+        """
+        :param reserve: (optional) The fraction of the rate limit that
+                        :data:`BACKGROUND` requests leave to the
+                        :data:`INTERACTIVE` ones.
+        :type reserve: float
+
+        :param max_retries: (optional) The number of times a request rejected
+                            for exceeding the rate limit is retried.
+        :type max_retries: int
+
+        :param max_wait: (optional) The longest time in seconds to wait before
+                         a request. Requests which would need to wait longer
+                         are sent, or returned, as they are.
+        :type max_wait: int
+
+        """
+
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.__budgets = dict()
+        self.__lock = threading.Lock()
+
+    _time = staticmethod(time.time)
+    _sleep = staticmethod(time.sleep)
+
+    def __budget(self, identity):
+        budget = self.__budgets.get(identity)
+        if budget is None:
+            budget = self.__budgets[identity] = _Budget()
+        return budget
+
+    def status(self, identity):
+        """
+        Returns a dict with the ``limit``, ``remaining`` and ``reset`` values
+        last seen for the authentication identity.
+        """
+        budget = self.__budget(identity)
+        return dict(limit=budget.limit, remaining=budget.remaining,
+                    reset=budget.reset)
+
+    def delay(self, identity, priority=INTERACTIVE):
+        """
+        Returns the number of seconds a request for the given identity and
+        priority should wait before it is sent, reserving its slot.
+        """
+        with self.__lock:
+            budget = self.__budget(identity)
+            now = self._time()
+            if budget.remaining is None or budget.reset is None or \
+                    budget.reset <= now:
+                return 0
+
+            window = budget.reset - now
+            if budget.remaining <= 0:
+                return window
+
+            if priority != BACKGROUND:
+                # count the request until its response tells the real value
+                budget.remaining -= 1
+                return 0
+
+            reserved = int((budget.limit or 0) * self.reserve)
+            spendable = budget.remaining - reserved
+            if spendable <= 0:
+                return window
+
+            # spread the spendable budget evenly over the rest of the window
+            slot = max(budget.next_slot, now)
+            budget.next_slot = slot + window / spendable
+            budget.remaining -= 1
+            return slot - now
+
+    def wait(self, identity, priority=None):
+        """Blocks until a request can be sent for the identity."""
+        delay = self.delay(identity, priority or current_priority())
+        if 0 < delay <= self.max_wait:
+            logging.debug('Rate limit: waiting %.2fs', delay)
+            self._sleep(delay)
+
+    def update(self, identity, response):
+        """
+        Records the rate limit headers of ``response``.
+
+        :returns: The number of seconds to wait before retrying the request if
+                  it was rejected for exceeding the rate limit, ``None``
+                  otherwise.
+        """
+        headers = response.headers
+        now = self._time()
+        with self.__lock:
+            budget = self.__budget(identity)
+            try:
+                if headers.get('x-ratelimit-limit') is not None:
+                    budget.limit = int(headers['x-ratelimit-limit'])
+                if headers.get('x-ratelimit-remaining') is not None:
+                    budget.remaining = int(headers['x-ratelimit-remaining'])
+                if headers.get('x-ratelimit-reset') is not None:
+                    budget.reset = float(headers['x-ratelimit-reset'])
+            except ValueError:
+                pass
+
+            if response.status_code not in (403, 429):
+                return None
+
+            retry_after = headers.get('retry-after')
+            if retry_after is not None:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+
+            if budget.remaining == 0 and budget.reset:
+                return max(budget.reset - now, 0) + 1
+
+        return None
+
+    def send(self, auth, request):
+        """
+        Sends a request authenticated with ``auth`` through the ``request``
+        callable, pacing it and retrying it when it is rejected for exceeding
+        the rate limit. Authentication objects which rotate several
+        credentials, such as :class:`~pyresto.auth.AuthPool`, are paced by
+        their own ``wait_time()`` instead.
+
+        :rtype: :class:`requests.Response`
+        """
+        identity = auth_identity(auth)
+        pool_wait = getattr(auth, 'wait_time', None)
+
+        attempt = 0
+        while True:
+            if pool_wait is None:
+                self.wait(identity)
+            else:
+                delay = pool_wait()
+                if 0 < delay <= self.max_wait:
+                    self._sleep(delay)
+
+            response = request()
+            retry_in = self.update(identity, response)
+            if retry_in is not None and pool_wait is not None:
+                retry_in = pool_wait()
+            if retry_in is None or attempt >= self.max_retries or \
+                    retry_in > self.max_wait:
+                return response
+
+            attempt += 1
+            logging.warning('Rate limit exceeded, retrying in %.2fs',
+                            retry_in)
+            self._sleep(retry_in)
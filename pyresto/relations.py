@@ -2,7 +2,55 @@ try:
     import json
 except ImportError:
     import simplejson as json
+import logging
+import operator
+import Queue
 import re
+import sys
+import threading
+import weakref
+
+from cache import RelationCache
+from compact import Record, compactor
+from concurrency import map_collect
+from identity import bind_identity_map, current_identity_map
+from paths import compile_path
+import serialization
+
+def _raw_value(item, name):
+    # the value of a field as it was received, not creating any models
+    if isinstance(item, dict):
+        return item.get(name)
+    if isinstance(item, Record):
+        return item._get(name)
+    data = item.__dict__
+    return data[name] if name in data else data.get('__' + name)
+
+
+def _to_columns(items, fields, format):
+    paths = [field.split('.') for field in fields]
+    columns = [list() for field in fields]
+    for item in items:
+        for column, path in zip(columns, paths):
+            value = _raw_value(item, path[0])
+            for key in path[1:]:
+                value = value.get(key) if isinstance(value, dict) else None
+            column.append(value)
+
+    if format == 'list':
+        return dict(zip(fields, columns))
+    elif format == 'numpy':
+        import numpy
+        return dict((field, numpy.array(column))
+                    for field, column in zip(fields, columns))
+    elif format == 'arrow':
+        import pyarrow
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(column) for column in columns], names=list(fields))
+
+    raise ValueError('Unknown column format "{0}", use one of: list, numpy, '
+                     'arrow'.format(format))
+
 
 class WrappedList(list):
     """
@@ -12,9 +60,18 @@ class WrappedList(list):
 
     """
 
-    def __init__(self, iterable, wrapper):
+    def __init__(self, iterable, wrapper, invalidator=None):
         super(self.__class__, self).__init__(iterable)
         self.__wrapper = wrapper
+        self.__invalidator = invalidator
+
+    def invalidate(self):
+        """
+        Drops this list from its relation's cache so the next access to the
+        relation fetches it again.
+        """
+        if self.__invalidator:
+            self.__invalidator()
 
     def __getitem__(self, key):
         item = super(self.__class__, self).__getitem__(key)
@@ -50,6 +107,31 @@ class WrappedList(list):
         # for the in operator.
         return item in iter(self)
 
+    def to_columns(self, fields, format='numpy'):
+        """
+        Exports the given fields of all the items in the list as columns,
+        read straight from the parsed data without creating any
+        :class:`Model` instances. Missing values are ``None``.
+
+        .. code-block:: python
+
+            columns = user.repos.to_columns(['watchers', 'forks', 'size'])
+            print columns['watchers'].sum()
+
+        :param fields: The field names, which can be dotted paths into nested
+                       objects such as ``'owner.login'``.
+        :type fields: list
+
+        :param format: (optional) ``'numpy'`` for a dict of NumPy arrays,
+                       ``'arrow'`` for a :class:`pyarrow.Table` or ``'list'``
+                       for a dict of lists. NumPy and Arrow are optional
+                       dependencies.
+        :type format: string
+
+        """
+        return _to_columns(super(self.__class__, self).__iter__(), fields,
+                           format)
+
 
 class LazyList(object):
     """
@@ -58,13 +140,44 @@ class LazyList(object):
     structured generator. No caching and memoization at all since the intended
     usage is for small number of iterations.
 
+    When ``prefetch`` is a positive number, the pages are fetched in a
+    background thread while the current page is being consumed, keeping at
+    most ``prefetch`` pages in memory ahead of the consumer.
+
     """
 
-    def __init__(self, wrapper, fetcher):
+    def __init__(self, wrapper, fetcher, prefetch=0, invalidator=None):
         self.__wrapper = wrapper
         self.__fetcher = fetcher
+        self.__prefetch = prefetch
+        self.__invalidator = invalidator
+
+    def invalidate(self):
+        """
+        Drops this list from its relation's cache so the next access to the
+        relation starts over with a new list.
+        """
+        if self.__invalidator:
+            self.__invalidator()
 
     def __iter__(self):
+        return (self.__wrapper(item) for item in self.__items())
+
+    def to_columns(self, fields, format='numpy'):
+        """
+        Consumes the list, exporting the given fields of its items as columns
+        without creating any :class:`Model` instances. See
+        :meth:`WrappedList.to_columns` for the parameters.
+        """
+        return _to_columns(self.__items(), fields, format)
+
+    def __items(self):
+        # the items as they are received, before they are wrapped
+        if self.__prefetch > 0:
+            return self.__iter_prefetched()
+        return self.__iter_serial()
+
+    def __iter_serial(self):
         fetcher = self.__fetcher
         while fetcher:
             # fetcher is stored locally to prevent interference between
@@ -72,10 +185,83 @@ class LazyList(object):
             data, fetcher = fetcher()  # this part never gets hit if the below
             # loop is not exhausted.
             for item in data:
-                yield self.__wrapper(item)
+                yield item
+
+    def __iter_prefetched(self):
+        # pages are chained through their continuation URLs so they can only
+        # be fetched one after another; a single producer thread runs ahead of
+        # the consumer and the bounded queue provides the back-pressure.
+        pages = Queue.Queue(maxsize=self.__prefetch)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def produce():
+            fetcher = self.__fetcher
+            try:
+                while fetcher and not stopped.is_set():
+                    data, fetcher = fetcher()
+                    if not put((data, None)):
+                        return
+            except Exception:
+                put((None, sys.exc_info()))
+                return
+            put(None)  # end of the list
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+
+                data, exc_info = page
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                for item in data:
+                    yield item
+        finally:
+            # also hit when the consumer closes the iterator early
+            stopped.set()
+
 
 class Relation(object):
-    """Base class for all relation types."""
+    """
+    Base class for all relation types. The resolved values are kept per owner
+    instance in :attr:`cache`, a :class:`~pyresto.cache.RelationCache`.
+    """
+
+    cache = None
+
+    def invalidate(self, instance=None):
+        """
+        Drops the cached value of the relation for ``instance`` or for all the
+        instances if it is omitted.
+        """
+        self.cache.invalidate(instance)
+
+    def _invalidator(self, instance):
+        # the owner is referenced weakly to not keep it alive through the
+        # cached value
+        owner = weakref.ref(instance)
+
+        def invalidate():
+            instance = owner()
+            if instance is not None:
+                self.cache.invalidate(instance)
+
+        return invalidate
 
 
 class Many(Relation):
@@ -87,7 +273,8 @@ class Many(Relation):
 
     """
 
-    def __init__(self, model, path=None, lazy=False, preprocessor=None):
+    def __init__(self, model, path=None, lazy=False, preprocessor=None,
+                 prefetch=0, cache=None, stream=False, compact=False):
         """
         Constructor for Many relation instances.
 
@@ -107,13 +294,61 @@ class Many(Relation):
                      generator.
         :type lazy: boolean
 
+        :param preprocessor: (optional) Either a function which receives the
+                             parsed data of a page and returns the list of the
+                             collection items in it, or the dotted key path of
+                             that list, such as ``'flags'`` for the data
+                             ``{"flags": [...]}``.
+        :type preprocessor: function or string
+
+        :param prefetch: (optional) The number of pages a lazy collection
+                         fetches ahead in the background while the current
+                         page is iterated. Read-ahead is disabled by default.
+        :type prefetch: int
+
+        :param cache: (optional) The cache to keep the collections in, which
+                      can be used to limit their number or lifetime. Defaults
+                      to an unbounded :class:`~pyresto.cache.RelationCache`.
+        :type cache: :class:`~pyresto.cache.RelationCache`
+
+        :param stream: (optional) Parse the items of each page one by one
+                       while the page is downloaded instead of parsing the
+                       whole page at once, so a lazy collection holds only a
+                       single item in memory. The ``preprocessor``, if any,
+                       must be a key path. Pages are parsed as a whole when
+                       the optional ``ijson`` package is not installed.
+        :type stream: boolean
+
+        :param compact: (optional) Hold the items of the collection as
+                        :class:`~pyresto.compact.Record` objects which share
+                        their field names and take a fraction of the memory of
+                        :class:`Model` instances. Meant for large, read-only
+                        collections.
+        :type compact: boolean
+
         """
 
         self.__model = model
         self.__path = path or model._path
+        self.__format_path = compile_path(self.__path)
         self.__lazy = lazy
+        self.__prefetch = prefetch
+
+        if isinstance(preprocessor, basestring):
+            keys = preprocessor.split('.')
+            self.__stream_path = '.'.join(keys + ['item'])
+            preprocessor = lambda data: reduce(operator.getitem, keys, data)
+        elif preprocessor is None:
+            self.__stream_path = 'item'
+        elif stream:
+            raise ValueError('Only key path preprocessors can be streamed.')
+        else:
+            self.__stream_path = None
+
+        self.__stream = stream and serialization.ijson is not None
+        self.__compact = compact
         self.__preprocessor = preprocessor
-        self.__cache = dict()
+        self.cache = cache if cache is not None else RelationCache()
 
     def _with_owner(self, owner):
         """
@@ -127,18 +362,34 @@ class Many(Relation):
 
         """
 
+        # a proxy, so the cached items do not keep their owner alive
+        owner = weakref.proxy(owner)
+        identities = current_identity_map()
+
         def mapper(data):
             if isinstance(data, dict):
                 instance = self.__model(**data)
                 instance._pyresto_owner = owner
+                if identities is not None:
+                    instance = identities.add(instance)
                 return instance
             elif isinstance(data, self.__model):
                 return data
             else:
                 raise TypeError("Invalid type passed to Many.")
 
+        if self.__compact:
+            return compactor(self.__model, mapper)
         return mapper
 
+    def __wrapped_list(self, instance, data):
+        wrapper = self._with_owner(instance)
+        if self.__compact:
+            # replace the dicts right away so only the records are kept
+            data = [wrapper(item) for item in data]
+        return WrappedList(data, wrapper,
+                           invalidator=self._invalidator(instance))
+
     def __sanitize_data(self, data):
         if not data:
             return list()
@@ -146,7 +397,7 @@ class Many(Relation):
             return self.__preprocessor(data)
         return data
 
-    def __make_fetcher(self, url, instance):
+    def __make_fetcher(self, url, auth):
         """
         A function factory method which creates a simple fetcher function for
         the :class:`Many` relation, that is used internally. The
@@ -159,22 +410,50 @@ class Many(Relation):
         :param url: The url which the fetcher function will be bound to.
         :type url: unicode
 
+        :param auth: The authentication object to fetch the pages with.
+
         """
 
         def fetcher():
-            data, new_url = self.__model._rest_call(url=url,
-                                                    auth=instance._auth,
-                                                    fetch_all=False)
-            # Note the fetch_all=False in the call above, since this method is
-            # intended for iterative LazyList calls.
-            data = self.__sanitize_data(data)
+            if self.__stream:
+                data, new_url = self.__model._rest_call(
+                    url=url, auth=auth, fetch_all=False,
+                    stream_path=self.__stream_path)
+            else:
+                data, new_url = self.__model._rest_call(url=url, auth=auth,
+                                                        fetch_all=False)
+                # Note the fetch_all=False in the call above, since this
+                # method is intended for iterative LazyList calls.
+                data = self.__sanitize_data(data)
 
             new_fetcher = self.__make_fetcher(new_url,
-                                              instance) if new_url else None
+                                              auth) if new_url else None
             return data, new_fetcher
 
         return fetcher
 
+    def seed(self, instance, data):
+        """
+        Fills the cache of the relation for ``instance`` using ``data``, which
+        is expected to be what fetching the relation path would return, so
+        accessing the relation does not need another request.
+
+        :param instance: The owner of the collection.
+        :type instance: Model
+
+        :returns: The cached collection.
+        """
+
+        data = self.__sanitize_data(data)
+        if self.__lazy:
+            value = LazyList(self._with_owner(instance), lambda: (data, None),
+                             invalidator=self._invalidator(instance))
+        else:
+            value = self.__wrapped_list(instance, data)
+
+        self.cache.set(instance, value)
+        return value
+
     def __get__(self, instance, owner):
         # This method is called whenever a field defined as Many is tried to
         # be accessed. There is also another usage which lacks an object
@@ -182,21 +461,30 @@ class Many(Relation):
         if not instance:
             return self.__model
 
-        cache = self.__cache
-        if instance not in cache:
+        value = self.cache.get(instance)
+        if value is None:
             model = self.__model
 
-            path = self.__path.format(**instance._footprint)
+            path = self.__format_path(instance._footprint)
 
             if self.__lazy:
-                cache[instance] = LazyList(self._with_owner(instance),
-                                           self.__make_fetcher(path, instance))
+                value = LazyList(self._with_owner(instance),
+                                 self.__make_fetcher(path, instance._auth),
+                                 prefetch=self.__prefetch,
+                                 invalidator=self._invalidator(instance))
             else:
-                data, next_url = model._rest_call(url=path,
-                                                  auth=instance._auth)
-                cache[instance] = WrappedList(self.__sanitize_data(data),
-                                              self._with_owner(instance))
-        return cache[instance]
+                if self.__stream:
+                    data = list(model._rest_call(
+                        url=path, auth=instance._auth,
+                        stream_path=self.__stream_path).data)
+                else:
+                    data, next_url = model._rest_call(url=path,
+                                                      auth=instance._auth)
+                    data = self.__sanitize_data(data)
+                value = self.__wrapped_list(instance, data)
+            self.cache.set(instance, value)
+
+        return value
 
 
 class Foreign(Relation):
@@ -208,7 +496,7 @@ class Foreign(Relation):
     """
 
     def __init__(self, model, key_property=None, key_extractor=None,
-                 embedded=False):
+                 embedded=False, cache=None):
         """
         Constructor for the :class:`Foreign` relations.
 
@@ -227,10 +515,15 @@ class Foreign(Relation):
                               extraction operations for foreign fields.
         :type key_extractor: function(model)
 
+        :param cache: (optional) The cache to keep the foreign instances in.
+                      Defaults to an unbounded
+                      :class:`~pyresto.cache.RelationCache`.
+        :type cache: :class:`~pyresto.cache.RelationCache`
+
         """
 
         self.__model = model
-        self.__cache = dict()
+        self.cache = cache if cache is not None else RelationCache()
         self.__embedded = embedded and not key_extractor
 
         self.__key_property = key_property or '__' + model.__name__.lower()
@@ -255,20 +548,153 @@ class Foreign(Relation):
 
             self.__key_extractor = extract
 
+    @property
+    def model(self):
+        """The :class:`Model` class of the foreign resource."""
+        return self.__model
+
+    @property
+    def embedded(self):
+        """``True`` if the foreign resource is embedded in its owner."""
+        return self.__embedded
+
+    def _key(self, instance):
+        """Returns the primary key values of the foreign resource."""
+        return tuple(self.__key_extractor(instance))
+
+    def seed(self, instance, value):
+        """
+        Fills the cache of the relation for ``instance`` with the already
+        fetched foreign :class:`Model` instance ``value``.
+        """
+        value._pyresto_owner = weakref.proxy(instance)
+        self.cache.set(instance, value)
+        return value
+
     def __get__(self, instance, owner):
         # Please see Many.__get__ for more info on this method.
         if not instance:
             return self.__model
 
-        if instance not in self.__cache:
+        value = self.cache.get(instance)
+        if value is None:
             if self.__embedded:
-                self.__cache[instance] = self.__model(
-                    **getattr(instance, self.__key_property))
-                self.__cache[instance]._auth = instance._auth
+                value = self.__model(**getattr(instance, self.__key_property))
+                value._auth = instance._auth
+                value._pyresto_owner = weakref.proxy(instance)
+
+                identities = current_identity_map()
+                if identities is not None:
+                    value = identities.add(value)
+            else:
+                value = self.__model.read(*self._key(instance),
+                                          auth=instance._auth)
+                value._pyresto_owner = weakref.proxy(instance)
+
+            self.cache.set(instance, value)
+
+        return value
+
+
+def _get_relation(model, name):
+    for cls in type(model).__mro__:
+        relation = cls.__dict__.get(name)
+        if isinstance(relation, Relation):
+            return relation
+
+    raise AttributeError('{0} has no relation named {1}'.format(
+        type(model).__name__, name))
+
+
+def prefetch_related(models, *names, **kwargs):
+    """
+    Resolves the given relations of all the ``models`` up front, with
+    parallel requests, and fills the relation caches so accessing them
+    afterwards does not cause a request per model.
+
+    .. code-block:: python
+
+        repos = prefetch_related(user.repos, 'owner', 'branches')
+
+    :class:`Foreign` resources referenced by more than one model are fetched
+    once using :meth:`Model.read_many`, which can batch them where the API
+    allows it. :class:`Many` relations are fetched one request per model, or
+    through the ``prefetch(*names)`` method of the models if they have one,
+    which can fetch several relations at once.
+
+    :param models: The models, a list or a :class:`WrappedList`.
+
+    :param concurrency: (optional) The maximum number of parallel requests,
+                        8 by default.
+    :type concurrency: int
+
+    :returns: The list of models whose relations are populated. Compact
+              :class:`~pyresto.compact.Record` items are materialised.
+    :rtype: list
+    """
+
+    concurrency = kwargs.pop('concurrency', 8)
+
+    # slicing a WrappedList wraps and caches the items, which iterating it
+    # would not, so the relations are cached on the instances kept in it
+    items = list(models[:]) if isinstance(models, WrappedList) \
+        else list(models)
+    if not items:
+        return items
+
+    # compact records have no relations, their models keep the caches
+    models = [item._materialize() if isinstance(item, Record) else item
+              for item in items]
+
+    foreign = list()
+    many = list()
+    for name in names:
+        relation = _get_relation(models[0], name)
+        (foreign if isinstance(relation, Foreign) else many).append(
+            (name, relation))
+
+    for name, relation in foreign:
+        if relation.embedded:
+            for model in models:
+                relation.__get__(model, type(model))
+            continue
+
+        owners = [m for m in models if m not in relation.cache]
+        if not owners:
+            continue
+
+        # several models usually point to the same resource, read it once
+        keys = list()
+        seen = set()
+        for model in owners:
+            key = relation._key(model)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+
+        results = relation.model.read_many(keys, concurrency=concurrency,
+                                           auth=owners[0]._auth)
+        values = dict(zip(keys, results))
+        for model in owners:
+            value = values.get(relation._key(model))
+            if value is not None:
+                relation.seed(model, value)
+
+    if many:
+        def fetch(model):
+            missing = [name for name, relation in many
+                       if model not in relation.cache]
+            if not missing:
+                return
+            if hasattr(type(model), 'prefetch'):
+                model.prefetch(*missing)
             else:
-                self.__cache[instance] = self.__model.get(
-                    *self.__key_extractor(instance), auth=instance._auth)
+                for name in missing:
+                    getattr(model, name)
 
-            self.__cache[instance]._pyresto_owner = instance
+        results = map_collect(bind_identity_map(fetch), models, concurrency)
+        for index, error in results.errors.iteritems():
+            # the relation is fetched again when it is accessed
+            logging.warning('Could not prefetch %s: %s', models[index], error)
 
-        return self.__cache[instance]
+    return items
@@ -0,0 +1,184 @@
+# coding: utf-8
+
+"""
+pyresto.serialization
+~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the JSON backends used by :attr:`Model._parser` and
+:attr:`Model._serializer`. The standard library ``json`` module is used by
+default. The faster ``orjson``, ``ujson``, ``simdjson`` and ``simplejson``
+backends are opt-in, globally or per model, since they differ in the types
+they return, such as ``simplejson`` returning ``str`` instead of ``unicode``
+for ASCII strings. Response bodies are parsed straight from their bytes,
+skipping the decoding of the whole body into a unicode string first.
+Large collections can also be parsed item by item while they are downloaded
+with :func:`iter_items`, which needs the optional ``ijson`` package.
+
+.. code-block:: python
+
+    set_json_backend()  # the fastest one installed, globally
+
+    class Commit(GitHubModel):
+        _parser = staticmethod(json_backend('ujson').loads)  # per model
+
+"""
+
+import collections
+import decimal
+import threading
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+__all__ = ('JSONBackend', 'BACKENDS', 'json_backend', 'available_backends',
+           'set_json_backend', 'loads', 'dumps', 'response_body',
+           'iter_items')
+
+#: The backend names in the order of preference.
+BACKENDS = ('orjson', 'ujson', 'simdjson', 'simplejson', 'json')
+
+#: A JSON backend, with its ``name`` and its ``loads`` and ``dumps``
+#: functions.
+JSONBackend = collections.namedtuple('JSONBackend', 'name loads dumps')
+
+# the encodings whose bytes all the backends can parse as they are
+_BYTE_ENCODINGS = frozenset(('utf-8', 'utf8', 'ascii', 'us-ascii'))
+
+_backends = dict()
+_default = None
+_lock = threading.Lock()
+
+
+def _import(name):
+    module = __import__(name)
+    if name == 'orjson':
+        # orjson.dumps returns bytes, which is what requests sends anyway
+        return JSONBackend(name, module.loads, module.dumps)
+    if name == 'simdjson':
+        import json
+        return JSONBackend(name, module.loads,
+                           getattr(module, 'dumps', json.dumps))
+    return JSONBackend(name, module.loads, module.dumps)
+
+
+def json_backend(name):
+    """
+    Returns the :data:`JSONBackend` with the given name.
+
+    :raises ValueError: If ``name`` is not one of :data:`BACKENDS`.
+    :raises ImportError: If the backend is not installed.
+    """
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown JSON backend "{0}", use one of: '
+                         '{1}'.format(name, ', '.join(BACKENDS)))
+
+    backend = _backends.get(name)
+    if backend is None:
+        backend = _backends[name] = _import(name)
+    return backend
+
+
+def available_backends():
+    """Returns the names of the installed backends, fastest first."""
+    names = list()
+    for name in BACKENDS:
+        try:
+            json_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def set_json_backend(name=None):
+    """
+    Sets the backend used by the models which do not override
+    :attr:`Model._parser` or :attr:`Model._serializer`, ``json`` by default.
+    The fastest installed backend is picked when ``name`` is omitted.
+
+    :rtype: :data:`JSONBackend`
+    """
+
+    global _default
+    backend = json_backend(name or available_backends()[0])
+    with _lock:
+        _default = backend
+    return backend
+
+
+def _current():
+    backend = _default
+    if backend is None:
+        backend = set_json_backend('json')
+    return backend
+
+
+def loads(data):
+    """Parses ``data``, a byte or unicode string, with the default backend."""
+    return _current().loads(data)
+
+
+def dumps(obj):
+    """Serializes ``obj`` to JSON with the default backend."""
+    return _current().dumps(obj)
+
+
+def response_body(response):
+    """
+    Returns the body of ``response`` to be parsed: its raw bytes when they are
+    UTF-8 encoded, as JSON is, or its decoded text otherwise.
+    """
+
+    encoding = getattr(response, 'encoding', None)
+    if isinstance(encoding, basestring) and \
+            encoding.lower().replace('_', '-') not in _BYTE_ENCODINGS:
+        return response.text
+    return response.content
+
+
+def _floats(value):
+    # ijson parses all the non-integer numbers as Decimal
+    if isinstance(value, dict):
+        for key, item in value.iteritems():
+            value[key] = _floats(item)
+    elif isinstance(value, list):
+        value[:] = [_floats(item) for item in value]
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def iter_items(response, prefix):
+    """
+    Returns a generator which parses the items found at ``prefix`` in the
+    body of the streamed ``response`` one by one, while the body is being
+    downloaded, so only a single item is held in memory at a time. The
+    response is closed when the generator is exhausted or closed.
+
+    :param prefix: The ijson prefix of the items, ``'item'`` for the items of
+                   a top level array or ``'flags.item'`` for the items of the
+                   array under the ``flags`` key of a top level object.
+    :type prefix: string
+
+    :raises ImportError: If ``ijson`` is not installed.
+    """
+
+    if ijson is None:
+        raise ImportError('Streaming JSON responses needs the ijson package.')
+
+    raw = response.raw
+    # let urllib3 take care of any gzip or deflate content encoding
+    raw.decode_content = True
+
+    def generate():
+        try:
+            for item in ijson.items(raw, prefix):
+                yield _floats(item)
+        finally:
+            close = getattr(response, 'close', None) or raw.close
+            close()
+
+    return generate()
@@ -0,0 +1,174 @@
+# coding: utf-8
+
+"""
+pyresto.transport
+~~~~~~~~~~~~~~~~~
+
+This module contains the pooled HTTP transport layer. Every API host gets its
+own :class:`Transport`, which owns a single keep-alive :class:`requests.Session`
+so the TCP and TLS handshakes are paid once per connection instead of once per
+request.
+
+"""
+
+import threading
+import urlparse
+
+import requests
+
+try:
+    from requests.adapters import HTTPAdapter
+except ImportError:  # requests < 1.0 configures pooling through `config`
+    HTTPAdapter = None
+
+__all__ = ('Transport', 'get_transport', 'configure_transport')
+
+
+class Transport(object):
+    """
+    A thin wrapper around a pooled :class:`requests.Session`. Instances are
+    shared between all the :class:`Model` classes using the same host, see
+    :func:`get_transport`.
+
+    """
+
+    def __init__(self, pool_size=10, max_retries=0, keep_alive=True,
+                 verify=True, scheduler=None):
+        """
+        :param pool_size: (optional) The maximum number of connections kept
+                          open to the host.
+        :type pool_size: int
+
+        :param max_retries: (optional) The number of retries for failed
+                            connection attempts.
+        :type max_retries: int
+
+        :param keep_alive: (optional) Whether connections should be reused
+                           between requests.
+        :type keep_alive: boolean
+
+        :param verify: (optional) Whether SSL certificates should be verified.
+        :type verify: boolean
+
+        :param scheduler: (optional) The
+                          :class:`~pyresto.ratelimit.RateLimiter` pacing the
+                          requests per authentication identity.
+        :type scheduler: :class:`~pyresto.ratelimit.RateLimiter`
+
+        """
+
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self.verify = verify
+        self.scheduler = scheduler
+        self.session = self._create_session()
+
+    def _create_session(self):
+        session = requests.Session()
+
+        if HTTPAdapter is not None:
+            adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size,
+                                  max_retries=self.max_retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+        else:
+            session.config.update(keep_alive=self.keep_alive,
+                                  pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size,
+                                  max_retries=self.max_retries)
+
+        return session
+
+    def request(self, method, url, scheduler=None, **kwargs):
+        """
+        Sends an HTTP request over the pooled session. All other keyword
+        arguments are passed to :meth:`requests.Session.request` as they are.
+
+        :param scheduler: (optional) The
+                          :class:`~pyresto.ratelimit.RateLimiter` to pace this
+                          request with instead of :attr:`scheduler`.
+        :type scheduler: :class:`~pyresto.ratelimit.RateLimiter`
+
+        :rtype: :class:`requests.Response`
+
+        """
+
+        kwargs.setdefault('verify', self.verify)
+        if HTTPAdapter is None and 'stream' in kwargs:
+            # requests < 1.0 calls it the other way around
+            kwargs['prefetch'] = not kwargs.pop('stream')
+        scheduler = scheduler or self.scheduler
+        if scheduler is None:
+            return self.session.request(method, url, **kwargs)
+
+        return scheduler.send(
+            kwargs.get('auth'),
+            lambda: self.session.request(method, url, **kwargs))
+
+    def close(self):
+        """Closes all the pooled connections."""
+        close = getattr(self.session, 'close', None)
+        if close:
+            close()
+
+
+_transports = dict()
+_transports_lock = threading.Lock()
+
+
+def _host_key(url):
+    parts = urlparse.urlsplit(url or '')
+    return parts.scheme.lower(), parts.netloc.lower()
+
+
+def get_transport(url):
+    """
+    Returns the shared :class:`Transport` for the host of the given ``url``,
+    creating one with the default settings if there isn't any yet.
+
+    :param url: Any URL on the host, usually :attr:`Model._url_base`.
+    :type url: string
+
+    :rtype: :class:`Transport`
+
+    """
+
+    key = _host_key(url)
+    transport = _transports.get(key)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(key)
+            if transport is None:
+                transport = _transports[key] = Transport()
+
+    return transport
+
+
+def configure_transport(url, **options):
+    """
+    Replaces the shared :class:`Transport` for the host of the given ``url``
+    with a new one created using ``options``. Any previous transport for the
+    host is closed.
+
+    .. code-block:: python
+
+        configure_transport(GitHubModel._url_base, pool_size=50, max_retries=3)
+
+    :rtype: :class:`Transport`
+
+    """
+
+    key = _host_key(url)
+    transport = Transport(**options)
+    with _transports_lock:
+        previous = _transports.get(key)
+        _transports[key] = transport
+
+    if previous is not None:
+        previous.close()
+
+    return transport
@@ -0,0 +1,153 @@
+# coding: utf-8
+
+import json
+import urlparse
+
+from mock import Mock
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pyresto.apis.bugzilla import mozilla
+from pyresto.exceptions import PyrestoServerResponseException
+
+
+class BugzillaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.responses = dict()
+
+        def request(method, url, **kwargs):
+            path = url[len(mozilla.BugzillaModel._url_base):]
+            self.requests.append(path)
+            data = self.responses[path.partition('?')[0]]
+            if callable(data):
+                data = data(urlparse.parse_qs(path.partition('?')[2]))
+            if data is None:
+                return Mock(status_code=404, text='', content='',
+                            headers=dict())
+            body = json.dumps(data)
+            return Mock(status_code=200, text=body, content=body,
+                        headers=dict())
+
+        mozilla.BugzillaModel._transport = Mock()
+        mozilla.BugzillaModel._transport.request.side_effect = request
+
+    def tearDown(self):
+        del mozilla.BugzillaModel._transport
+
+
+class TestBugzillaModel(BugzillaTestCase):
+    def test_repr(self):
+        comment = mozilla.Comment(text='partial')
+        self.assertEqual(repr(comment), '<Bugzilla.Comment [/comment/None]>')
+        self.assertEqual(repr(mozilla.Comment(ref='r')),
+                         '<Bugzilla.Comment [r]>')
+        self.assertEqual(self.requests, [])
+
+    def test_project_path(self):
+        project = mozilla.Bug._project_path
+        self.assertEqual(project('bug/5', ['summary', 'id']),
+                         'bug/5?include_fields=id,summary')
+        self.assertEqual(project('bug/5?include_fields=_all&exclude_fields=cc'
+                                 '&x=1', ['id']),
+                         'bug/5?x=1&include_fields=id')
+
+    def test_read_fields(self):
+        self.responses['bug/5'] = {'id': 5, 'summary': 'Crash'}
+
+        bug = mozilla.Bug.read(5, fields=('summary',))
+        self.assertEqual(self.requests, ['bug/5?include_fields=summary'])
+        self.assertEqual(bug.summary, 'Crash')
+
+
+class TestBug(BugzillaTestCase):
+    def test_read_many(self):
+        self.responses['bug'] = lambda query: {'bugs': [
+            {'id': int(id), 'summary': 'Bug ' + id}
+            for id in query['id'][0].split(',') if id != '3']}
+
+        bugs = mozilla.Bug.read_many([1, 2, 2, 3])
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(self.requests[0].startswith('bug?id=1,2,3&'))
+        self.assertEqual([bug and bug.summary for bug in bugs],
+                         ['Bug 1', 'Bug 2', 'Bug 2', None])
+        self.assertIs(bugs[1], bugs[2])
+        self.assertEqual(list(bugs.errors), [3])
+        self.assertIsInstance(bugs.errors[3], PyrestoServerResponseException)
+        self.assertEqual(bugs.errors[3].status_code, 404)
+
+    def test_read_many_batches(self):
+        self.responses['bug'] = lambda query: {'bugs': [
+            {'id': int(id)} for id in query['id'][0].split(',')]}
+
+        bugs = mozilla.Bug.read_many(range(250))
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual([bug.id for bug in bugs], range(250))
+        self.assertTrue(bugs.ok)
+
+    def test_read_many_options(self):
+        self.responses['bug'] = lambda query: {'bugs': [
+            {'id': int(id), 'summary': 'Bug ' + id, 'status': 'NEW',
+             'comments': [{'id': 1, 'text': 'c' + id}]}
+            for id in query['id'][0].split(',')]}
+
+        bugs = mozilla.Bug.read_many([1, 2], fields=('summary',),
+                                     include=('comments',))
+        self.assertEqual(len(self.requests), 1)
+        query = urlparse.parse_qs(self.requests[0].partition('?')[2])
+        self.assertEqual(query['include_fields'], ['comments,id,summary'])
+        self.assertNotIn('status', bugs[0].__dict__)
+        self.assertEqual([comment.text for comment in bugs[1].comments],
+                         ['c2'])
+        self.assertEqual(len(self.requests), 1)
+
+        bugs = mozilla.Bug.read_many([3], include=('comments',))
+        query = urlparse.parse_qs(self.requests[1].partition('?')[2])
+        self.assertEqual(query['include_fields'], ['_all,comments'])
+        self.assertNotIn('comments', query['exclude_fields'][0].split(','))
+
+    def test_read_many_fallback(self):
+        self.responses['bug/7'] = {'id': 7, 'summary': 'Exact'}
+
+        bugs = mozilla.Bug.read_many([7], path='bug/7')
+        self.assertEqual(self.requests, ['bug/7'])
+        self.assertEqual(bugs[0].summary, 'Exact')
+
+    def test_read_include(self):
+        self.responses['bug/5'] = {
+            'id': 5, 'summary': 'Crash',
+            'comments': [{'id': 1, 'text': 'a'}, {'id': 2, 'text': 'b'}]}
+
+        bug = mozilla.Bug.read(5, include=('comments',))
+        self.assertEqual(len(self.requests), 1)
+        query = urlparse.parse_qs(self.requests[0].partition('?')[2])
+        self.assertEqual(query['include_fields'], ['_all,comments'])
+        self.assertNotIn('comments', query['exclude_fields'][0].split(','))
+
+        self.assertEqual([comment.text for comment in bug.comments],
+                         ['a', 'b'])
+        self.assertEqual(len(self.requests), 1)
+
+    def test_prefetch(self):
+        self.responses['bug/5'] = lambda query: (
+            {'comments': [{'id': 1, 'text': 'a'}],
+             'history': [{'when': 'now', 'changes': []}]}
+            if query['include_fields'] == ['comments,history'] else
+            {'id': 5, 'summary': 'Crash'})
+
+        bug = mozilla.Bug.read(5)
+        bug.prefetch('comments', 'history')
+        self.assertEqual(len(self.requests), 2)
+
+        self.assertEqual([comment.text for comment in bug.comments], ['a'])
+        self.assertEqual([change.when for change in bug.history], ['now'])
+        self.assertEqual(len(self.requests), 2)
+
+        bug.prefetch('comments')  # already there
+        self.assertEqual(len(self.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
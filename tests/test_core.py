@@ -1,15 +1,44 @@
 # coding: utf-8
 
+import gc
+import json
+import shutil
+import StringIO
+import tempfile
+import time
+import weakref
+
 from mock import Mock
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from requests.auth import HTTPBasicAuth
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
-from pyresto.core import Model
-from pyresto.relations import WrappedList, LazyList, Many
-from pyresto.exceptions import PyrestoInvalidAuthTypeException
-from pyresto.auth import AuthList, enable_auth
+from pyresto.client import BaseClient
+from pyresto.core import Model, Result, no_implicit_fetch
+from pyresto.relations import (WrappedList, LazyList, Many, Foreign,
+                               prefetch_related)
+from pyresto.identity import IdentityMap, current_identity_map
+from pyresto.concurrency import SingleFlight, imap_ordered
+from pyresto.exceptions import (PyrestoInvalidAuthTypeException,
+                                PyrestoImplicitFetchException,
+                                PyrestoServerResponseException)
+from pyresto.auth import AuthList, AuthPool, enable_auth, auth_identity
+from pyresto.ratelimit import RateLimiter, BACKGROUND, INTERACTIVE, priority
+from pyresto.transport import Transport, get_transport, configure_transport
+from pyresto.cache import (CacheEntry, ResponseCache, MemoryCache, DiskCache,
+                           RelationCache)
+from pyresto import serialization
+from pyresto.changes import UNCHANGED, merge_patch, snapshot
+from pyresto.compact import Record
+from pyresto.paths import compile_path
+from pyresto.serialization import (json_backend, available_backends,
+                                   set_json_backend, response_body)
 
 
 class MockModel(Model):
@@ -27,6 +56,32 @@ class TestModelBase(unittest.TestCase):
         with self.assertRaises(TypeError):
             IdlessModel()
 
+    def test_compile_path(self):
+        footprint = {'user': 'u', 'id': 7, 'self': Mock(name_='n')}
+        for template in ('/a/{user}/{id}', u'/{{x}}/{id}', '{self.name_}/x',
+                         '/{id:03d}', '/{{plain}}%'):
+            self.assertEqual(compile_path(template)(footprint),
+                             template.format(**footprint))
+        self.assertIs(compile_path('/a/{id}'), compile_path('/a/{id}'))
+        self.assertTrue(compile_path('{self.name_}').uses_self)
+        self.assertFalse(compile_path('/a/{id}').uses_self)
+
+    def test_cached_footprint(self):
+        class PathModel(Model):
+            _path = '/owners/{owner}/items/{id}'
+            _pk = ('owner', 'id')
+
+        instance = PathModel(owner='a', id=1)
+        instance._pk_vals = ('a', 1)
+        self.assertIs(instance._footprint, instance._footprint)
+        self.assertIs(instance._pk_vals, instance._pk_vals)
+        self.assertEqual(instance._current_path, '/owners/a/items/1')
+
+        instance.id = 2
+        self.assertEqual(instance._pk_vals, ('a', 2))
+        self.assertEqual(instance._footprint['id'], 2)
+        self.assertEqual(instance._current_path, '/owners/a/items/2')
+
 
 class TestWrappedList(unittest.TestCase):
     def setUp(self):
@@ -93,6 +148,482 @@ class TestLazyList(unittest.TestCase):
             for item, orig in zip(self.instance, self.list):
                 self.assertEqual(item.id, orig['id'])
 
+    def test_prefetch(self):
+        instance = LazyList(self.wrapper, self.fetcher, prefetch=2)
+        for i in xrange(2):
+            self.assertEqual([item.id for item in instance], [1, 2])
+
+    def test_prefetch_error(self):
+        def failing():
+            raise ValueError('broken page')
+
+        instance = LazyList(self.wrapper,
+                            lambda: (self.list[:1], failing), prefetch=1)
+        iterator = iter(instance)
+        self.assertEqual(next(iterator).id, 1)
+        self.assertRaises(ValueError, next, iterator)
+
+    def test_prefetch_close(self):
+        fetched = []
+
+        def endless():
+            fetched.append(1)
+            return self.list, endless
+
+        iterator = iter(LazyList(self.wrapper, endless, prefetch=1))
+        next(iterator)
+        iterator.close()
+        count = len(fetched)
+        time.sleep(0.3)
+        # the producer must stop once the iterator is closed
+        self.assertLessEqual(len(fetched), count + 1)
+
+
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        self.data = [{'id': 1, 'size': 10, 'owner': {'login': 'a'}},
+                     {'id': 2, 'size': 20, 'owner': {'login': 'b'}},
+                     {'id': 3}]
+        self.wrapper = Mock(side_effect=lambda d: MockModel(**d))
+
+    def test_wrapped_list(self):
+        items = WrappedList(self.data, self.wrapper)
+        items[0].size = 11  # modified models are exported as they are
+        self.wrapper.reset_mock()
+        columns = items.to_columns(['size', 'owner.login'], format='list')
+        self.assertEqual(columns, {'size': [11, 20, None],
+                                   'owner.login': ['a', 'b', None]})
+        self.assertFalse(self.wrapper.called)
+
+    def test_lazy_list(self):
+        items = LazyList(self.wrapper, lambda: (self.data, None))
+        columns = items.to_columns(['id'], format='list')
+        self.assertEqual(columns, {'id': [1, 2, 3]})
+        self.assertFalse(self.wrapper.called)
+
+        with self.assertRaises(ValueError):
+            items.to_columns(['id'], format='csv')
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_numpy(self):
+        columns = WrappedList(self.data[:2], self.wrapper).to_columns(['size'])
+        self.assertEqual(columns['size'].sum(), 30)
+
+
+class TestTransport(unittest.TestCase):
+    def test_shared_per_host(self):
+        a = get_transport('https://example.com/api/')
+        b = get_transport('https://EXAMPLE.com/other')
+        self.assertIsInstance(a, Transport)
+        self.assertIs(a, b)
+        self.assertIsNot(a, get_transport('https://example.org/'))
+
+    def test_configure(self):
+        old = get_transport('https://configured.example.com/')
+        new = configure_transport('https://configured.example.com/',
+                                  pool_size=3)
+        self.assertIsNot(old, new)
+        self.assertEqual(new.pool_size, 3)
+        self.assertIs(get_transport('https://configured.example.com/x'), new)
+
+    def test_model_transport(self):
+        class HostModel(Model):
+            _url_base = 'https://model.example.com/'
+            _pk = 'id'
+
+        self.assertIs(HostModel._get_transport(),
+                      get_transport('https://model.example.com/'))
+
+        transport = Transport()
+        HostModel._transport = transport
+        self.assertIs(HostModel._get_transport(), transport)
+
+    def test_verify(self):
+        class UnverifiedModel(Model):
+            _url_base = 'https://unverified.example.com/'
+            _pk = 'id'
+
+        transport = UnverifiedModel._transport = Transport(verify=False)
+        transport.session = Mock()
+        transport.session.request.return_value = Mock(
+            status_code=200, content='[]', headers=dict())
+
+        UnverifiedModel._rest_call('/items')
+        self.assertIs(transport.session.request.call_args[1]['verify'], False)
+
+    def test_client_get(self):
+        transport = Mock()
+
+        class Client(BaseClient):
+            url = 'https://client.example.com/items'
+            transport = property(lambda self: transport)
+
+        Client(auth='secret').get(page=2)
+        transport.request.assert_called_once_with(
+            'get', 'https://client.example.com/items', params={'page': 2},
+            auth='secret')
+
+    def test_scheduler(self):
+        class PacedModel(Model):
+            _url_base = 'https://paced.example.com/'
+            _pk = 'id'
+            _scheduler = Mock()
+
+        transport = PacedModel._transport = Transport(scheduler=Mock())
+        transport.session = Mock()
+        transport.session.request.return_value = Mock(
+            status_code=200, content='[]', headers=dict())
+        PacedModel._scheduler.send.side_effect = lambda auth, send: send()
+
+        PacedModel._rest_call('/items')
+        self.assertEqual(PacedModel._scheduler.send.call_count, 1)
+        self.assertFalse(transport.scheduler.send.called)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.responses = []
+        self.transport = Mock()
+        self.transport.request.side_effect = lambda *a, **kw: \
+            self.responses.pop(0)
+        MockModel._transport = self.transport
+        MockModel._response_cache = MemoryCache()
+
+    def response(self, status_code, text='', headers=None):
+        return Mock(status_code=status_code, text=text, content=text,
+                    headers=headers or dict())
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            ResponseCache()
+
+    def test_not_modified(self):
+        self.responses = [self.response(200, '[1, 2]', {'etag': '"abc"'}),
+                          self.response(304)]
+        first = MockModel._rest_call('/cached').data
+        first.append(3)  # must not leak into the cache
+        second = MockModel._rest_call('/cached').data
+
+        self.assertEqual(second, [1, 2])
+        headers = self.transport.request.call_args[1]['headers']
+        self.assertEqual(headers['If-None-Match'], '"abc"')
+
+    def test_not_modified_nested(self):
+        self.responses = [self.response(200, '{"meta": {"a": 1}}',
+                                        {'etag': '"abc"'}),
+                          self.response(304), self.response(304)]
+        first = MockModel._rest_call('/cached').data
+        first['meta']['a'] = 2
+        second = MockModel._rest_call('/cached').data
+        self.assertEqual(second, {'meta': {'a': 1}})
+
+        second['meta']['a'] = 3  # nor does a hit share its data
+        self.assertEqual(MockModel._rest_call('/cached').data,
+                         {'meta': {'a': 1}})
+
+    def test_modified(self):
+        self.responses = [self.response(200, '[1]', {'etag': '"a"'}),
+                          self.response(200, '[2]', {'etag': '"b"'})]
+        MockModel._rest_call('/cached')
+        self.assertEqual(MockModel._rest_call('/cached').data, [2])
+
+    def test_no_validator(self):
+        self.responses = [self.response(200, '[1]'), self.response(200, '[2]')]
+        MockModel._rest_call('/cached')
+        MockModel._rest_call('/cached')
+        self.assertEqual(len(MockModel._response_cache), 0)
+        self.assertNotIn('headers', self.transport.request.call_args[1])
+
+    def test_memory_budget(self):
+        cache = MemoryCache(max_bytes=10)
+        cache.set('a', CacheEntry('"a"', None, 1, None, 6))
+        cache.set('b', CacheEntry('"b"', None, 2, None, 4))
+        cache.get('a')
+        cache.set('c', CacheEntry('"c"', None, 3, None, 4))
+        # "b" is the least recently used one
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a').data, 1)
+        self.assertEqual(cache.size, 10)
+
+    def test_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = DiskCache(directory)
+            key = ('/url', None, None)
+            cache.set(key, CacheEntry('"a"', None, {'id': 1}, None, 9))
+            self.assertEqual(DiskCache(directory).get(key).data, {'id': 1})
+            cache.delete(key)
+            self.assertIsNone(cache.get(key))
+        finally:
+            shutil.rmtree(directory)
+
+    def tearDown(self):
+        del MockModel._transport, MockModel._response_cache
+
+
+class TestSerialization(unittest.TestCase):
+    def test_backends(self):
+        self.assertIn('json', available_backends())
+        self.assertEqual(json_backend('json').loads('[1]'), [1])
+        with self.assertRaises(ValueError):
+            json_backend('yaml')
+
+    def test_default(self):
+        self.assertEqual(serialization._current().name, 'json')
+        self.assertEqual(Model._parser('{"a": 1}'), {'a': 1})
+        self.assertIsInstance(Model._parser('["a"]')[0], unicode)
+        self.assertEqual(Model._serializer({'a': 1}), '{"a": 1}')
+
+    def test_response_body(self):
+        body = u'{"name": "\u00e7"}'.encode('utf-8')
+        response = Mock(content=body, text=body.decode('utf-8'),
+                        encoding='utf-8')
+        self.assertIs(response_body(response), body)
+        self.assertEqual(Model._parser(response_body(response)),
+                         {'name': u'\u00e7'})
+
+        response.encoding = 'ISO-8859-1'
+        self.assertIs(response_body(response), response.text)
+
+
+@unittest.skipUnless(serialization.ijson, 'ijson is not installed')
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.pages = {'/s': ('{"data": [{"id": 1, "v": 1.5}, {"id": 2}]}',
+                             {'link': '</s?page=2>; rel="next"'}),
+                      '/s?page=2': ('{"data": [{"id": 3}]}', {})}
+        self.transport = Mock()
+        self.transport.request.side_effect = self.request
+        MockModel._transport = self.transport
+        MockModel._continuator = classmethod(
+            lambda cls, response: response.headers.get('link') and '/s?page=2')
+
+    def request(self, method, url, **kwargs):
+        body, headers = self.pages[url.replace('http://', '/')]
+        return Mock(status_code=200, raw=StringIO.StringIO(body),
+                    headers=headers)
+
+    def test_rest_call(self):
+        data, next_url = MockModel._rest_call('/s', stream_path='data.item')
+        self.assertNotIsInstance(data, list)
+        self.assertEqual(list(data), [{'id': 1, 'v': 1.5}, {'id': 2},
+                                      {'id': 3}])
+        self.assertIsInstance(MockModel._rest_call(
+            '/s', stream_path='data.item').data.next()['v'], float)
+        self.assertTrue(self.transport.request.call_args[1]['stream'])
+
+    def test_many(self):
+        relation = Many(MockModel, '/s', lazy=True, preprocessor='data',
+                        stream=True)
+        items = list(relation.__get__(MockModel(id=5), MockModel))
+        self.assertEqual([item.id for item in items], [1, 2, 3])
+        self.assertIsInstance(items[0], MockModel)
+
+    def test_key_path(self):
+        relation = Many(MockModel, '/s', preprocessor='data')
+        MockModel._rest_call = classmethod(
+            lambda cls, url, **kwargs: Result({'data': [{'id': 7}]}, None))
+        try:
+            self.assertEqual(relation.__get__(MockModel(id=5), MockModel)[0].id,
+                             7)
+        finally:
+            del MockModel._rest_call
+
+        with self.assertRaises(ValueError):
+            Many(MockModel, '/s', preprocessor=lambda d: d, stream=True)
+
+    def tearDown(self):
+        del MockModel._transport, MockModel._continuator
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_coalesce(self):
+        calls = []
+
+        def slow_request(*args, **kwargs):
+            calls.append(args)
+            time.sleep(0.1)
+            return Mock(status_code=200, text='[1]', content='[1]',
+                        headers=dict())
+
+        MockModel._transport = Mock()
+        MockModel._transport.request.side_effect = slow_request
+        MockModel._single_flight = SingleFlight()
+        try:
+            results = list(imap_ordered(lambda i: MockModel._rest_call('/hot'),
+                                        range(4), 4))
+        finally:
+            del MockModel._transport, MockModel._single_flight
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.data for r in results], [[1]] * 4)
+        # every caller gets its own list
+        self.assertEqual(len(set(id(r.data) for r in results)), 4)
+
+    def test_shared_copy(self):
+        shared = Result([{'a': [1]}], None)
+        MockModel._single_flight = Mock()
+        try:
+            MockModel._single_flight.do.return_value = (shared, True)
+            result = MockModel._rest_call('/hot')
+            MockModel._single_flight.do.return_value = (shared, False)
+            alone = MockModel._rest_call('/hot')
+        finally:
+            del MockModel._single_flight
+
+        self.assertEqual(result.data, [{'a': [1]}])
+        self.assertIsNot(result.data[0]['a'], shared.data[0]['a'])
+        self.assertIs(alone.data, shared.data)  # not shared, not copied
+
+    def test_multi_valued_params(self):
+        MockModel._transport = Mock()
+        MockModel._transport.request.return_value = Mock(
+            status_code=200, content='[1]', headers=dict())
+        try:
+            for params in ({'labels': ['a', 'b']}, [('labels', ['a', 'b'])]):
+                self.assertEqual(MockModel._rest_call('/a',
+                                                      params=params).data, [1])
+        finally:
+            del MockModel._transport
+
+    def test_error(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError
+
+        self.assertRaises(ValueError, flight.do, 'key', fail)
+        self.assertEqual(flight.do('key', lambda: 1), (1, False))
+        self.assertEqual(flight.stats(), dict(calls=2, coalesced=0))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.slept = []
+        self.limiter = RateLimiter(reserve=0.1)
+        self.limiter._time = lambda: self.now
+        self.limiter._sleep = self.sleep
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def response(self, status_code=200, remaining=None, reset=None,
+                 limit=100, **headers):
+        if remaining is not None:
+            headers.update({'x-ratelimit-remaining': str(remaining),
+                            'x-ratelimit-reset': str(reset),
+                            'x-ratelimit-limit': str(limit)})
+        return Mock(status_code=status_code, headers=headers)
+
+    def test_unknown_budget(self):
+        self.assertEqual(self.limiter.delay('a', BACKGROUND), 0)
+
+    def test_interactive(self):
+        self.limiter.update('a', self.response(remaining=5, reset=1100))
+        self.assertEqual(self.limiter.delay('a'), 0)
+        self.assertEqual(self.limiter.status('a')['remaining'], 4)
+
+        self.limiter.update('a', self.response(remaining=0, reset=1100))
+        self.assertEqual(self.limiter.delay('a'), 100)
+
+    def test_background(self):
+        self.limiter.update('a', self.response(remaining=60, reset=1100))
+        # 50 spendable requests over 100 seconds, 10 are reserved
+        delays = [self.limiter.delay('a', BACKGROUND) for i in xrange(3)]
+        self.assertEqual(delays[0], 0)
+        self.assertAlmostEqual(delays[1], 2.0)
+        self.assertAlmostEqual(delays[2], 2.0 + 100.0 / 49)
+
+        self.limiter.update('a', self.response(remaining=10, reset=1100))
+        self.assertEqual(self.limiter.delay('a', BACKGROUND), 100)
+        self.assertEqual(self.limiter.delay('a', INTERACTIVE), 0)
+
+    def test_priority(self):
+        self.limiter.update('a', self.response(remaining=10, reset=1100))
+        with priority(BACKGROUND):
+            self.limiter.wait('a')
+        self.limiter.wait('a')
+        self.assertEqual(self.slept, [100])
+
+    def test_retry(self):
+        responses = [self.response(403, remaining=0, reset=1010),
+                     self.response(429, **{'retry-after': '3'}),
+                     self.response(200, remaining=99, reset=4600)]
+        response = self.limiter.send(HTTPBasicAuth('a', 'x'),
+                                     lambda: responses.pop(0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slept, [11, 3])
+
+    def test_pool(self):
+        pool = Mock()
+        pool.wait_time.side_effect = [0, 0, 0]
+        responses = [self.response(403, remaining=0, reset=2000),
+                     self.response(200, remaining=99, reset=2000)]
+        response = self.limiter.send(pool, lambda: responses.pop(0))
+        # the pool had another credential, so there was no waiting
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slept, [0])
+
+    def test_identities(self):
+        self.limiter.update(auth_identity(HTTPBasicAuth('a', 'x')),
+                            self.response(remaining=0, reset=1100))
+        self.assertEqual(
+            self.limiter.delay(auth_identity(HTTPBasicAuth('b', 'x'))), 0)
+        self.assertEqual(
+            self.limiter.delay(auth_identity(HTTPBasicAuth('a', 'y'))), 100)
+
+
+class TestAuthPool(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.credentials = [Mock(side_effect=lambda r: r, username=name)
+                            for name in 'abc']
+        self.pool = AuthPool(self.credentials)
+        self.pool._time = lambda: self.now
+
+    def send(self, status_code=200, **headers):
+        request = Mock()
+        self.pool(request)
+        hook = request.register_hook.call_args[0][1]
+        hook(Mock(status_code=status_code, headers=headers))
+        return [c for c in self.credentials if c.called][-1]
+
+    def test_rotation(self):
+        self.send(**{'x-ratelimit-remaining': '10', 'x-ratelimit-limit': '50',
+                     'x-ratelimit-reset': '4600'})
+        self.send(**{'x-ratelimit-remaining': '30',
+                     'x-ratelimit-reset': '4600'})
+        self.send(**{'x-ratelimit-remaining': '20',
+                     'x-ratelimit-reset': '4600'})
+        for credential in self.credentials:
+            credential.reset_mock()
+        # the second credential has the most remaining quota
+        self.assertIs(self.send(), self.credentials[1])
+        stats = self.pool.stats()
+        self.assertEqual([s['requests'] for s in stats], [1, 2, 1])
+        self.assertEqual(stats[0]['utilisation'], 0.8)
+
+    def test_exhausted(self):
+        for name in 'abc':
+            self.send(403, **{'x-ratelimit-remaining': '0',
+                              'x-ratelimit-reset': str(self.now + ord(name))})
+        self.assertEqual(self.pool.wait_time(), ord('a'))
+        self.assertFalse(any(s['available'] for s in self.pool.stats()))
+
+        self.now += ord('a') + 1
+        self.assertEqual(self.pool.wait_time(), 0)
+
+    def test_registration(self):
+        auth_list = AuthList(pool=AuthPool)
+        auth = enable_auth(auth_list, MockModel, 'pool')
+        try:
+            auth(credentials=self.credentials)
+            self.assertIsInstance(MockModel._auth, AuthPool)
+        finally:
+            del MockModel._auth
+
 
 class TestAuthList(unittest.TestCase):
     def setUp(self):
@@ -203,9 +734,606 @@ class TestManyList(unittest.TestCase):
         del MockModel.list_many
 
 
+class TestRestCall(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        pages = {'/list': ([1, 2], '/list?page=2'),
+                 '/list?page=2': ([3], '/list?page=3'),
+                 '/list?page=3': ([4, 5], None),
+                 '/single': ({'id': 1}, '/single?more')}
+
+        @classmethod
+        def fetch_page_mock(cls, url, method='GET', **kwargs):
+            self.calls.append((url, method, kwargs))
+            return pages[url]
+
+        MockModel._fetch_page = fetch_page_mock
+
+    def test_iter_pages(self):
+        pages = list(MockModel._iter_pages('/list'))
+        self.assertEqual(pages, [[1, 2], [3], [4, 5]])
+
+    def test_fetch_all(self):
+        data, next_url = MockModel._rest_call('/list', auth='a')
+        self.assertEqual(data, [1, 2, 3, 4, 5])
+        self.assertIsNone(next_url)
+        # every page should be fetched with the same method and auth
+        self.assertEqual([c[1:] for c in self.calls],
+                         [('GET', {'auth': 'a'})] * 3)
+
+    def test_fetch_all_post(self):
+        # the body is not sent again to the continuation URL
+        data, next_url = MockModel._rest_call('/list', 'POST', data='{}')
+        self.assertEqual(data, [1, 2])
+        self.assertEqual(next_url, '/list?page=2')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_fetch_one(self):
+        data, next_url = MockModel._rest_call('/list', fetch_all=False)
+        self.assertEqual(data, [1, 2])
+        self.assertEqual(next_url, '/list?page=2')
+
+    def test_non_list(self):
+        data, next_url = MockModel._rest_call('/single')
+        self.assertEqual(data, {'id': 1})
+        self.assertEqual(next_url, '/single?more')  # not followed
+        self.assertEqual(len(self.calls), 1)
+
+    def test_fan_out(self):
+        MockModel._fan_out = 4
+        MockModel._page_urls = classmethod(
+            lambda cls, url: ['/list?page=2', '/list?page=3'])
+        try:
+            data, next_url = MockModel._rest_call('/list')
+        finally:
+            del MockModel._fan_out, MockModel._page_urls
+
+        self.assertEqual(data, [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(c[0] for c in self.calls),
+                         ['/list', '/list?page=2', '/list?page=3'])
+
+    def tearDown(self):
+        del MockModel._fetch_page
+
+
+class TestReadMany(unittest.TestCase):
+    def setUp(self):
+        self.reads = []
+
+        @classmethod
+        def read_mock(cls, *args, **kwargs):
+            self.reads.append(args)
+            if args[0] == 3:
+                raise ValueError('missing')
+            return cls(id=args[0], **kwargs)
+
+        MockModel.read = read_mock
+
+    def test_order_and_dedupe(self):
+        results = MockModel.read_many([2, 1, (2,), 3, 1], concurrency=3,
+                                      extra='x')
+        self.assertEqual([r and r.id for r in results], [2, 1, 2, None, 1])
+        self.assertEqual(sorted(self.reads), [(1,), (2,), (3,)])
+        self.assertEqual(results[0].extra, 'x')
+        self.assertFalse(results.ok)
+        self.assertEqual(results.errors.keys(), [3])
+        self.assertIsInstance(results.errors[3], ValueError)
+
+    def tearDown(self):
+        del MockModel.read
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            self.calls.append(url)
+            return Result({'id': 7, 'name': 'a', 'size': 3, 'url': 'u'}, None)
+
+        MockModel._rest_call = rest_call_mock
+
+    def test_read(self):
+        instance = MockModel.read(7, fields=('name',))
+        self.assertEqual(instance.name, 'a')
+        self.assertEqual(instance.id, 7)  # pk fields are always kept
+        self.assertNotIn('size', instance.__dict__)
+        self.assertEqual(len(self.calls), 1)
+
+        # the default implementation cannot fetch a single field, so this
+        # fetches everything and ends the projection
+        self.assertEqual(instance.size, 3)
+        self.assertIsNone(instance._projection)
+        self.assertRaises(AttributeError, getattr, instance, 'missing')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_partial_fetch(self):
+        MockModel._project_path = classmethod(
+            lambda cls, path, fields: path + '?only=' + ','.join(fields))
+        try:
+            instance = MockModel.read(7, fields=('name',))
+            self.assertEqual(instance.size, 3)
+            self.assertEqual(instance._projection,
+                             frozenset(('name', 'size')))
+        finally:
+            del MockModel._project_path
+
+        self.assertEqual(self.calls, ['/mockmodel/7?only=name',
+                                      '/mockmodel/7?only=size'])
+
+    def test_default_fields(self):
+        MockModel._fields = ('url',)
+        try:
+            instance = MockModel.read(7)
+        finally:
+            del MockModel._fields
+        self.assertEqual(instance._projection, frozenset(('url',)))
+
+    def tearDown(self):
+        del MockModel._rest_call
+
+
+class TestAsyncCalls(unittest.TestCase):
+    def test_aread(self):
+        @classmethod
+        def read_mock(cls, *args, **kwargs):
+            time.sleep(0.05)
+            return cls(id=args[0])
+
+        MockModel.read = read_mock
+        try:
+            results = [MockModel.aread(i) for i in xrange(3)]
+            self.assertEqual([r.get(1).id for r in results], [0, 1, 2])
+        finally:
+            del MockModel.read
+
+    def test_error(self):
+        @classmethod
+        def delete_mock(cls, instance, auth=None):
+            raise ValueError(instance.id)
+
+        MockModel.delete = delete_mock
+        try:
+            result = MockModel.adelete(MockModel(id=1))
+            self.assertRaises(ValueError, result.get, 1)
+        finally:
+            del MockModel.delete
+
+
+class TestRelationCache(unittest.TestCase):
+    def test_weak_owner(self):
+        cache = RelationCache()
+        owner = MockModel(id=1)
+        cache.set(owner, [1])
+        self.assertEqual(cache.get(owner), [1])
+        del owner
+        gc.collect()
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = RelationCache(max_size=2)
+        owners = [MockModel(id=i) for i in xrange(3)]
+        cache.set(owners[0], 0)
+        cache.set(owners[1], 1)
+        cache.get(owners[0])
+        cache.set(owners[2], 2)
+        self.assertIsNone(cache.get(owners[1]))
+        self.assertEqual(cache.get(owners[0]), 0)
+        self.assertEqual(cache.stats(), dict(size=2, hits=2, misses=1,
+                                             evictions=1))
+
+    def test_ttl(self):
+        cache = RelationCache(ttl=0.05)
+        owner = MockModel(id=1)
+        cache.set(owner, 1)
+        self.assertIn(owner, cache)
+        time.sleep(0.1)
+        self.assertNotIn(owner, cache)
+        self.assertIsNone(cache.get(owner))
+
+    def test_many_invalidate(self):
+        calls = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            calls.append(url)
+            return [{'id': len(calls)}], None
+
+        MockModel._rest_call = rest_call_mock
+        MockModel.cached_many = Many(MockModel, '/many')
+        try:
+            instance = MockModel(id=13)
+            self.assertEqual(instance.cached_many[0].id, 1)
+            self.assertEqual(instance.cached_many[0].id, 1)
+            instance.cached_many.invalidate()
+            self.assertEqual(instance.cached_many[0].id, 2)
+            self.assertEqual(len(calls), 2)
+
+            items = instance.cached_many
+            del instance, items
+            gc.collect()
+            self.assertEqual(len(MockModel.__dict__['cached_many'].cache), 0)
+        finally:
+            del MockModel._rest_call, MockModel.cached_many
+
+
+class TestIdentityMap(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            self.calls.append(url)
+            if url == '/many':
+                return Result([{'id': 1, 'name': 'a'}, {'id': 1, 'name': 'b'},
+                               {'id': 2}], None)
+            return Result({'id': int(url.rsplit('/', 1)[1]), 'full': True},
+                          None)
+
+        MockModel._rest_call = rest_call_mock
+        MockModel.identity_many = Many(MockModel, '/many')
+        MockModel.identity_foreign = Foreign(MockModel, '__identity_foreign',
+                                             embedded=True)
+
+    def test_scope(self):
+        self.assertIsNone(current_identity_map())
+        with IdentityMap() as identities:
+            self.assertIs(current_identity_map(), identities)
+        self.assertIsNone(current_identity_map())
+
+    def test_read(self):
+        with IdentityMap() as identities:
+            a = MockModel.read(5)
+            b = MockModel.read(5)
+            self.assertIs(a, b)
+            self.assertEqual(len(identities), 1)
+        self.assertEqual(len(self.calls), 1)
+        self.assertIsNot(MockModel.read(5), a)
+
+    def test_merge_is_not_a_change(self):
+        with IdentityMap() as identities:
+            a = MockModel.read(5)
+            other = MockModel(id=5, extra=5)
+            other._pk_vals = (5,)
+            self.assertIs(identities.add(other), a)
+            self.assertEqual(a.extra, 5)
+            MockModel.update(a)
+        self.assertEqual(self.calls, ['/mockmodel/5'])  # no PATCH
+
+    def test_relations(self):
+        with IdentityMap():
+            items = list(MockModel(id=13).identity_many)
+            self.assertIs(items[0], items[1])
+            # the first instance keeps its data, missing data is merged
+            self.assertEqual(items[0].name, 'a')
+
+            owner = MockModel(id=14, identity_foreign={'id': 2})
+            self.assertIs(owner.identity_foreign, items[2])
+
+            # a full read updates the shared instance in place
+            self.assertIs(MockModel.read(1), items[0])
+            self.assertTrue(items[0].full)
+
+    def tearDown(self):
+        del MockModel._rest_call, MockModel.identity_many, \
+            MockModel.identity_foreign
+
+
+class TestManySeed(unittest.TestCase):
+    def test_seed(self):
+        MockModel.seeded_many = Many(MockModel, '/many',
+                                     preprocessor=lambda d: d['items'])
+        MockModel._rest_call = Mock()
+        try:
+            instance = MockModel(id=13)
+            MockModel.__dict__['seeded_many'].seed(
+                instance, {'items': [{'id': 1}, {'id': 2}]})
+            self.assertEqual([i.id for i in instance.seeded_many], [1, 2])
+            self.assertFalse(MockModel._rest_call.called)
+        finally:
+            del MockModel.seeded_many, MockModel._rest_call
+
+
+class TestCompact(unittest.TestCase):
+    def setUp(self):
+        MockModel.compact_many = Many(MockModel, '/compact', compact=True)
+        MockModel.compact_foreign = Foreign(MockModel, '__compact_foreign',
+                                            embedded=True)
+        MockModel._rest_call = classmethod(
+            lambda cls, url, **kwargs: Result([
+                {'id': 1, 'name': 'a', 'compact_foreign': {'id': 9}},
+                {'id': 2, 'name': 'b', 'compact_foreign': {'id': 9}}], None))
+        self.items = MockModel(id=5).compact_many
+
+    def test_fields(self):
+        records = list(self.items)
+        self.assertEqual([r.name for r in records], ['a', 'b'])
+        with self.assertRaises(AttributeError):
+            records[0].__dict__
+        self.assertIs(records[0]._layout, records[1]._layout)
+        self.assertIsNone(records[0]._model)
+
+    def test_materialize(self):
+        record = self.items[0]
+        self.assertEqual(record.compact_foreign.id, 9)
+        self.assertIsInstance(record._model, MockModel)
+
+        other = self.items[1]
+        other.name = 'c'
+        self.assertEqual(other.name, 'c')
+        self.assertEqual(other._model._changed, set(['name']))
+
+    def tearDown(self):
+        del MockModel.compact_many, MockModel.compact_foreign, \
+            MockModel._rest_call
+
+
+class TestPrefetchRelated(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.reads = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            self.calls.append(url)
+            return Result([{'id': url}], None)
+
+        @classmethod
+        def read_many_mock(cls, keys, concurrency=8, **kwargs):
+            self.reads.append(keys)
+            return [cls(id=key[0]) for key in keys]
+
+        MockModel._rest_call = rest_call_mock
+        MockModel.read_many = read_many_mock
+        MockModel.prefetched_many = Many(MockModel, '/many/{self.id}')
+        MockModel.prefetched_foreign = Foreign(MockModel, 'parent_id')
+
+    def test_prefetch(self):
+        models = WrappedList([{'id': 1, 'parent_id': 10},
+                              {'id': 2, 'parent_id': 20},
+                              {'id': 3, 'parent_id': 10}],
+                             lambda d: MockModel(**d))
+        result = prefetch_related(models, 'prefetched_many',
+                                  'prefetched_foreign')
+        self.assertEqual(sorted(self.calls),
+                         ['/many/1', '/many/2', '/many/3'])
+        self.assertEqual(self.reads, [[(10,), (20,)]])
+
+        # everything is cached on the models kept in the list
+        self.assertIs(result[0], models[0])
+        self.assertEqual(models[1].prefetched_many[0].id, '/many/2')
+        self.assertEqual(models[1].prefetched_foreign.id, 20)
+        self.assertEqual(models[2].prefetched_foreign.id, 10)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_prefetch_compact(self):
+        owner = MockModel(id=1)
+        owner._pk_vals = (1,)
+        items = Many(MockModel, '/compact/{id}', compact=True)
+        records = items.__get__(owner, MockModel)
+        self.assertIsInstance(records[0], Record)
+        self.calls = []
+
+        result = prefetch_related(records, 'prefetched_many')
+        self.assertIs(result[0], records[0])
+        self.assertEqual(self.calls, ['/many//compact/1'])
+        self.assertEqual(records[0].prefetched_many[0].id, '/many//compact/1')
+        self.assertEqual(len(self.calls), 1)
+        self.assertIs(weakref.ref(records[0])(), records[0])
+
+    def tearDown(self):
+        del MockModel._rest_call, MockModel.read_many, \
+            MockModel.prefetched_many, MockModel.prefetched_foreign
+
+
 class TestForeign(unittest.TestCase):
     pass
 
 
+class TestLazyFetch(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.calls = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            self.calls.append(url)
+            return Result({'id': 1, 'name': 'n{0}'.format(len(self.calls))},
+                          None)
+
+        MockModel._rest_call = rest_call_mock
+        MockModel._time = staticmethod(lambda: self.now)
+
+    def test_negative(self):
+        instance = MockModel(id=1)
+        self.assertFalse(hasattr(instance, '__html__'))
+        self.assertEqual(self.calls, [])
+
+        self.assertFalse(hasattr(instance, 'typo'))
+        self.assertFalse(hasattr(instance, 'typo'))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_strict(self):
+        instance = MockModel(id=1)
+        with no_implicit_fetch():
+            with self.assertRaises(PyrestoImplicitFetchException):
+                instance.name
+            self.assertEqual(self.calls, [])
+            self.assertEqual(instance.ensure_fetched().name, 'n1')
+
+        MockModel._strict = True
+        try:
+            with self.assertRaises(PyrestoImplicitFetchException):
+                MockModel(id=2).name
+        finally:
+            del MockModel._strict
+
+    def test_ttl(self):
+        MockModel._ttl = {None: 60, 'name': 10}
+        try:
+            instance = MockModel(id=1).ensure_fetched()
+            self.assertFalse(instance.is_stale())
+            self.now += 30
+            self.assertTrue(instance.is_stale('name'))
+            self.assertFalse(instance.is_stale('id'))
+
+            instance.ensure_fetched('id')
+            self.assertEqual(len(self.calls), 1)
+            instance.ensure_fetched('name')
+            self.assertEqual(instance.name, 'n2')
+
+            self.now += 61
+            self.assertFalse(hasattr(instance, 'typo'))  # refetches
+            self.assertEqual(len(self.calls), 3)
+        finally:
+            del MockModel._ttl
+
+    def test_refresh(self):
+        instance = MockModel(id=1).ensure_fetched()
+        instance.name = 'changed'
+        instance.refresh()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(instance.name, 'changed')
+
+    def tearDown(self):
+        del MockModel._rest_call, MockModel._time
+
+
+class TestBulkWrites(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.failures = dict()
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            self.calls.append((method, url))
+            codes = self.failures.get(url)
+            if codes:
+                raise PyrestoServerResponseException('failed', codes.pop(0))
+            return Result({}, None)
+
+        MockModel._rest_call = rest_call_mock
+        MockModel._sleep = staticmethod(lambda seconds: None)
+
+    def instances(self, count):
+        instances = list()
+        for id in xrange(count):
+            instance = MockModel(id=id)
+            instance._pk_vals = (id,)
+            instances.append(instance)
+        return instances
+
+    def test_bulk_update(self):
+        instances = self.instances(4)
+        for instance in instances[1:]:
+            instance.name = 'new'
+        self.failures = {'/mockmodel/1': [503],
+                         '/mockmodel/2': [400]}
+
+        results = MockModel.bulk_update(instances, concurrency=2)
+        self.assertIs(results[0], instances[0])
+        self.assertIs(results[1], instances[1])
+        self.assertIsNone(results[2])
+        self.assertEqual(results.errors.keys(), [2])
+        self.assertEqual(results.errors[2].status_code, 400)
+        # the unchanged instance is not sent, the 503 one is retried
+        self.assertEqual(sorted(url for method, url in self.calls),
+                         ['/mockmodel/1', '/mockmodel/1', '/mockmodel/2',
+                          '/mockmodel/3'])
+        self.assertEqual(instances[1]._changed, set())
+
+        self.calls = []
+        instances[3].other = 'x'
+        results = MockModel.bulk_update(instances, keys=['other'])
+        self.assertEqual(self.calls, [('PATCH', '/mockmodel/3')])
+        self.assertEqual(instances[2]._changed, set(['name']))
+
+    def test_bulk_delete(self):
+        self.failures = {'/mockmodel/0': [502, 404],
+                         '/mockmodel/1': [404]}
+        results = MockModel.bulk_delete(self.instances(3))
+        self.assertEqual(list(results), [True, None, True])
+        self.assertEqual(results.errors.keys(), [1])
+
+    def tearDown(self):
+        del MockModel._rest_call, MockModel._sleep
+
+
+class TestChanges(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+
+        @classmethod
+        def rest_call_mock(cls, url, method='GET', fetch_all=True, **kwargs):
+            if method == 'GET':
+                return Result({'id': 1, 'title': 't', 'count': 1,
+                               'meta': {'labels': ['a'], 'owner': {'x': 1},
+                                        'state': 'open'}}, None)
+            self.sent.append((method, json.loads(kwargs['data'])))
+            return Result({'etag': 'e2'}, None)
+
+        MockModel._rest_call = rest_call_mock
+
+    def test_merge_patch(self):
+        previous = snapshot({'a': {'b': 1, 'c': [1]}, 'd': 1})
+        self.assertIs(merge_patch({'a': {'b': 1, 'c': [1]}, 'd': 1}, previous),
+                      UNCHANGED)
+        self.assertEqual(merge_patch({'a': {'b': 2, 'c': [1]}}, previous),
+                         {'a': {'b': 2}, 'd': None})
+        self.assertEqual(merge_patch({'a': {'b': 1, 'c': [1, 2]}, 'd': True},
+                                     previous),
+                         {'a': {'c': [1, 2]}, 'd': True})
+        # hash(-1) == hash(-2) in CPython, values are compared
+        self.assertEqual(merge_patch({'a': {'b': 1, 'c': [-2]}, 'd': -2},
+                                     snapshot({'a': {'b': 1, 'c': [-1]},
+                                               'd': -1})),
+                         {'a': {'c': [-2]}, 'd': -2})
+
+    def test_patch(self):
+        instance = MockModel(id=1).ensure_fetched()
+        MockModel.update(instance)
+        self.assertEqual(self.sent, [])  # nothing changed, no request
+
+        instance.meta['labels'].append('b')  # in place, not tracked
+        instance.meta['owner']['x'] = 2
+        instance.count = 1  # same value, but set explicitly
+        MockModel.update(instance)
+        self.assertEqual(self.sent, [('PATCH', {'count': 1, 'meta': {
+            'labels': ['a', 'b'], 'owner': {'x': 2}}})])
+        self.assertEqual(instance.etag, 'e2')
+        self.assertEqual(instance._changed, set())
+
+        MockModel.update(instance)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_hash_collision(self):
+        instance = MockModel(id=1).ensure_fetched()
+        instance.__dict__['count'] = -1
+        instance._take_snapshot()
+        instance.count = -2
+        MockModel.update(instance)
+        self.assertEqual(self.sent, [('PATCH', {'count': -2})])
+
+    def test_put_new_instance(self):
+        instance = MockModel(id=1, title='new')  # never fetched
+        MockModel.update_with_put(instance)
+        self.assertEqual(self.sent, [('PUT', {'id': 1, 'title': 'new'})])
+
+    def test_put(self):
+        instance = MockModel(id=1).ensure_fetched()
+        MockModel.update_with_put(instance)
+        self.assertEqual(self.sent, [])
+
+        instance.title = 'new'
+        MockModel.update_with_put(instance)
+        method, data = self.sent[0]
+        self.assertEqual(method, 'PUT')
+        self.assertEqual(sorted(data), ['count', 'id', 'meta', 'title'])
+
+    def tearDown(self):
+        del MockModel._rest_call
+
+
 class TestModel(unittest.TestCase):
     pass
@@ -3,11 +3,16 @@ try:
 except ImportError:
     import unittest
 
+from pyresto.core import Result
 from pyresto.mcash import McashModel
 from pyresto.auth import Auth
 from wtforms import fields
 from wtforms import validators
 import wtforms
+import json
+import threading
+import time
+import mock
 
 
 class SecretAuth(Auth):
@@ -53,6 +58,110 @@ class TestRelatedModelClass(McashModel):
         pubkey = fields.StringField()
 
 
+class TestValidatedModelClass(McashModel):
+    _url_base = "https://playgroundmcashservice.appspot.com"
+    _path = "/merchantapi/v1/merchant/{id}/"
+    _list_path = "/merchantapi/v1/merchant/"
+    _pk = ('id',)
+    _exclude_from_save = ('id',)
+
+    class Form(wtforms.Form):
+        id = fields.StringField()
+        name = fields.StringField(validators=[validators.DataRequired()])
+        code = fields.StringField(validators=[validators.Length(max=3)])
+
+        def validate_code(form, field):
+            if field.data and not field.data.isupper():
+                raise validators.ValidationError('Not upper case')
+
+
+class TestValidation(unittest.TestCase):
+
+    def test_form_built_once(self):
+        with mock.patch.object(TestValidatedModelClass, 'Form',
+                               wraps=TestValidatedModelClass.Form) as form:
+            obj = TestValidatedModelClass(name='Acme')
+            for code in ('A', 'AB', 'ABC'):
+                obj.code = code
+        self.assertEqual(form.call_count, 1)
+
+    def test_field_validation(self):
+        obj = TestValidatedModelClass(name='Acme')
+        self.assertRaises(ValueError, setattr, obj, 'code', 'ABCD')
+        self.assertRaises(ValueError, setattr, obj, 'code', 'abc')
+        obj.code = 'ABC'
+        self.assertEqual(obj.code, 'ABC')
+        self.assertRaises(ValueError, TestValidatedModelClass, code='abc')
+
+    def test_full_validation_deferred(self):
+        obj = TestValidatedModelClass(code='ABC')  # name is still missing
+        self.assertRaises(ValueError, obj.validate)
+        with mock.patch.object(TestValidatedModelClass, '_rest_call') as call:
+            self.assertRaises(ValueError, obj.save)
+        self.assertFalse(call.called)
+
+        obj.name = 'Acme'
+        self.assertTrue(obj.validate())
+
+
+class TestSaveMany(unittest.TestCase):
+
+    def test_save_many(self):
+        def rest_call(url, method='GET', **kwargs):
+            data = json.loads(kwargs['data'])
+            if data['name'] == 'Broken':
+                raise ValueError('Server error')
+            return Result({'id': 'id' + data['code']}, None)
+
+        objs = [TestValidatedModelClass(name='Acme', code='A%d' % i)
+                for i in range(5)]
+        objs[1] = TestValidatedModelClass(code='A1')  # name is missing
+        objs[3].name = 'Broken'
+        with mock.patch.object(TestValidatedModelClass, '_rest_call',
+                               side_effect=rest_call) as call:
+            results = TestValidatedModelClass.save_many(objs, concurrency=3)
+
+        self.assertEqual(call.call_count, 4)
+        self.assertEqual(sorted(results.errors), [1, 3])
+        self.assertEqual(results[0], objs[0])
+        self.assertEqual(results[1], None)
+        self.assertEqual(objs[4].id, 'idA4')
+        self.assertEqual(objs[4]._changed, set())
+        for args, kwargs in call.call_args_list:
+            self.assertEqual(kwargs['method'], 'POST')
+            self.assertEqual(kwargs['url'], '/merchantapi/v1/merchant/')
+
+    def test_save_many_groups_concurrently(self):
+        lock = threading.Lock()
+        state = dict(active=0, peak=0, urls=[])
+
+        def rest_call(url, method='GET', **kwargs):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+                state['urls'].append(url)
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return Result({'id': url}, None)
+
+        objs = [TestValidatedModelClass(parent=mock.Mock(_current_path='/m%d'
+                                                         % (i % 4)),
+                                        name='Acme', code='A%d' % i)
+                for i in range(8)]
+        with mock.patch.object(TestValidatedModelClass, 'validate',
+                               autospec=True) as validate:
+            with mock.patch.object(TestValidatedModelClass, '_rest_call',
+                                   side_effect=rest_call):
+                results = TestValidatedModelClass.save_many(objs,
+                                                            concurrency=4)
+
+        self.assertTrue(results.ok)
+        self.assertEqual(validate.call_count, 8)  # once per instance
+        self.assertEqual(state['peak'], 4)
+        self.assertEqual(objs[5].id, '/m1/merchantapi/v1/merchant/')
+
+
 class TestModel(unittest.TestCase):
 
     def test_constructor(self):